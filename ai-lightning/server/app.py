@@ -15,12 +15,17 @@ from models import db, User, Session, Node, Transaction, DepositInvoice, Platfor
 from lightning import LightningManager
 from nodemanager import NodeManager
 from utils.helpers import validate_model, get_model_price
-from utils.decorators import rate_limit, validate_json, validate_model_param
+from utils.decorators import rate_limit, validate_json, validate_model_param, is_admin_user
+from utils.json_provider import ORJSONProvider
 from datetime import datetime, timedelta
 import httpx
 import click
+import atexit
+import time
 import logging
 import json
+import orjson
+import redis
 
 # Logging configuration
 logging.basicConfig(
@@ -36,6 +41,7 @@ template_dir = os.path.join(base_dir, 'web-client')
 static_dir = os.path.join(base_dir, 'web-client')
 
 app = Flask(__name__, template_folder=template_dir, static_folder=static_dir, static_url_path='')
+app.json = ORJSONProvider(app)
 app.config.from_object(Config)
 db.init_app(app)
 socketio = SocketIO(app, cors_allowed_origins="*")
@@ -78,8 +84,19 @@ def get_node_manager():
     global node_manager
     if node_manager is None:
         node_manager = NodeManager(app.config)
+        # Nodes registered before the model_nodes:<model> indexes existed
+        try:
+            node_manager.backfill_model_index()
+        except redis.RedisError as e:
+            logger.warning(f"Could not backfill the node model index: {e}")
     return node_manager
 
+@atexit.register
+def close_node_manager():
+    """Close the node HTTP client pool on worker shutdown."""
+    if node_manager is not None:
+        node_manager.close()
+
 def validate_model_list(models):
     """Validate that all models in the list are valid."""
     if not models or not isinstance(models, dict):
@@ -323,6 +340,8 @@ def login():
     user = User.query.filter_by(username=data['username'].strip()).first()
     if not user or not user.check_password(data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
+    if user in db.session.dirty:
+        db.session.commit()  # Persist a password hash upgraded to argon2
     
     # Check if email is verified
     if not user.email_verified:
@@ -576,7 +595,7 @@ def get_wallet_transactions():
         per_page = min(per_page, 100)  # Max 100 per page
         
         from models import Transaction
-        transactions = Transaction.query.filter_by(user_id=int(user_id))\
+        transactions = Transaction.list_query().filter_by(user_id=int(user_id))\
             .order_by(Transaction.created_at.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
@@ -886,9 +905,7 @@ def admin_required():
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            user_id = get_jwt_identity()
-            user = User.query.get(int(user_id))
-            if not user or not user.is_admin:
+            if not is_admin_user(get_jwt_identity()):
                 return jsonify({'error': 'Admin access required'}), 403
             return f(*args, **kwargs)
         return decorated_function
@@ -900,11 +917,11 @@ def admin_required():
 def get_admin_stats():
     """Platform statistics (admin only)."""
     user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
+    is_admin = is_admin_user(user_id)
     
-    logger.info(f"Admin stats requested by user {user_id}, is_admin: {user.is_admin if user else 'None'}")
+    logger.info(f"Admin stats requested by user {user_id}, is_admin: {is_admin}")
     
-    if not user or not user.is_admin:
+    if not is_admin:
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -969,10 +986,7 @@ def get_admin_stats():
 @jwt_required()
 def get_admin_users():
     """User list (admin only)."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1004,10 +1018,7 @@ def get_admin_users():
 @jwt_required()
 def get_admin_transactions():
     """All transactions (admin only)."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1017,17 +1028,23 @@ def get_admin_transactions():
         per_page = request.args.get('per_page', 50, type=int)
         tx_type = request.args.get('type')  # Filter by type
         
-        query = Transaction.query
+        query = Transaction.list_query()
         if tx_type:
             query = query.filter_by(type=tx_type)
         
         transactions = query.order_by(Transaction.created_at.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
+        # Resolve all usernames for the page in one query
+        user_ids = {tx.user_id for tx in transactions.items}
+        usernames = dict(
+            db.session.query(User.id, User.username).filter(User.id.in_(user_ids)).all()
+        ) if user_ids else {}
+        
         return jsonify({
             'transactions': [{
                 **tx.to_dict(),
-                'username': User.query.get(tx.user_id).username if User.query.get(tx.user_id) else 'Unknown'
+                'username': usernames.get(tx.user_id, 'Unknown')
             } for tx in transactions.items],
             'total': transactions.total,
             'pages': transactions.pages
@@ -1042,10 +1059,7 @@ def get_admin_transactions():
 @jwt_required()
 def get_admin_commissions():
     """Commission report (admin only)."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1083,10 +1097,7 @@ def get_admin_commissions():
 @jwt_required()
 def get_admin_settings():
     """Get server settings (admin only)."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1107,10 +1118,7 @@ def get_admin_settings():
 @jwt_required()
 def update_admin_settings():
     """Update server settings (admin only). Note: Some settings require server restart."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1137,10 +1145,7 @@ def update_admin_settings():
 @jwt_required()
 def get_admin_nodes():
     """Get detailed node list with versions (admin only)."""
-    user_id = get_jwt_identity()
-    user = User.query.get(int(user_id))
-    
-    if not user or not user.is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Admin access required'}), 403
     
     try:
@@ -1910,9 +1915,9 @@ def start_session(data):
 
     # Start session on HTTP node
     try:
-        node_id_str = node[b'id'].decode() if isinstance(node[b'id'], bytes) else node[b'id']
+        node_id_str = node['id']
         node_info = nm.start_remote_session(
-            node_id_str,
+            node,
             session.id,
             session.model,
             Config.AVAILABLE_MODELS[session.model]['context']
@@ -2044,13 +2049,13 @@ def handle_message(data):
             emit('error', {'message': 'Node not found'})
             return
         
-        node_address = node_data[b'address'].decode()
+        node_address = node_data['address']
         
         # Use the new proxy endpoint on node (port 9000)
         # This internally handles communication with llama.cpp
-        llama_response = httpx.post(
+        llama_response = nm.http.post(
             f"http://{node_address}:9000/api/completion/{session.id}",
-            json={
+            content=orjson.dumps({
                 'prompt': data['prompt'],
                 'max_tokens': data.get('max_tokens', 2048),
                 'temperature': data.get('temperature', 0.05),
@@ -2058,7 +2063,7 @@ def handle_message(data):
                 'top_p': data.get('top_p', 0.95),
                 'repeat_penalty': data.get('repeat_penalty', 1.1),
                 'stop': data.get('stop', [])
-            },
+            }),
             timeout=180  # 3 minutes for long generations
         )
         
@@ -2169,21 +2174,10 @@ def end_session(data):
 @jwt_required()
 def list_nodes():
     """List all nodes (admin only)."""
-    user_id = get_jwt_identity()
-    if not User.query.get(user_id).is_admin:
+    if not is_admin_user(get_jwt_identity()):
         return jsonify({'error': 'Unauthorized'}), 403
 
-    nodes = get_node_manager().get_all_nodes()
-    # Convert bytes to strings for JSON serialization
-    result = []
-    for n in nodes:
-        node_dict = {}
-        for k, v in n.items():
-            key = k.decode() if isinstance(k, bytes) else k
-            val = v.decode() if isinstance(v, bytes) else v
-            node_dict[key] = val
-        result.append(node_dict)
-    return jsonify(result)
+    return jsonify(list(get_node_manager().iter_nodes()))
 
 
 # Node heartbeat endpoint
@@ -2196,12 +2190,8 @@ def node_heartbeat():
     if not node_id:
         return jsonify({'error': 'Missing node_id'}), 400
     
-    nm = get_node_manager()
-    nm.node_heartbeat(node_id)
-    
-    # Also update load if provided
-    if 'load' in data:
-        nm.redis.hset(f"node:{node_id}", 'load', data['load'])
+    # Ping and (if provided) load in one round-trip
+    get_node_manager().node_heartbeat(node_id, data.get('load'))
     
     return jsonify({'status': 'ok'})
 
@@ -2522,10 +2512,9 @@ def handle_node_register(data):
         # Search existing node with this token
         nm = get_node_manager()
         for nid in nm.redis.smembers(nm.nodes_set_key):
-            nid_str = nid.decode() if isinstance(nid, bytes) else nid
-            node_data = nm.redis.hgetall(f"node:{nid_str}")
-            if node_data.get(b'token', b'').decode() == token:
-                node_id = nid_str
+            node_data = nm.redis.hgetall(f"node:{nid}")
+            if node_data.get('token') == token:
+                node_id = nid
                 break
     
     if not node_id:
@@ -2546,7 +2535,7 @@ def handle_node_register(data):
             'allowed_models_list': json.dumps(allowed_models_list) if allowed_models_list else '[]',
             'status': 'online',
             'type': 'websocket',
-            'last_ping': datetime.utcnow().timestamp(),
+            'last_ping': time.time(),
             'load': 0,
             'version': node_version
         }
@@ -2554,14 +2543,16 @@ def handle_node_register(data):
         if owner_user_id:
             node_data_redis['owner_user_id'] = owner_user_id
         
-        nm.redis.hset(f"node:{node_id}", mapping=node_data_redis)
-        nm.redis.sadd(nm.nodes_set_key, node_id)
+        with nm.redis.pipeline() as pipe:
+            pipe.hset(f"node:{node_id}", mapping=node_data_redis)
+            pipe.sadd(nm.nodes_set_key, node_id)
+            pipe.execute()
     else:
         # Update existing node
         nm = get_node_manager()
         update_data = {
             'status': 'online',
-            'last_ping': datetime.utcnow().timestamp(),
+            'last_ping': time.time(),
             'price_per_minute': price_per_minute,
             'restricted_models': '1' if restricted_models else '0',
             'allowed_models_list': json.dumps(allowed_models_list) if allowed_models_list else '[]',
@@ -2909,7 +2900,7 @@ def handle_node_models_update(data):
     nm = get_node_manager()
     update_data = {
         'models': json.dumps(models),
-        'last_ping': datetime.utcnow().timestamp()
+        'last_ping': time.time()
     }
     if hardware:
         update_data['hardware'] = json.dumps(hardware)
@@ -2953,7 +2944,7 @@ def handle_node_settings_update(data):
     # Also update in Redis
     nm = get_node_manager()
     update_data = {
-        'last_ping': datetime.utcnow().timestamp(),
+        'last_ping': time.time(),
         'restricted_models': '1' if data.get('restricted_models') else '0',
         'allowed_models_list': json.dumps(data.get('allowed_models_list', [])),
         'price_per_minute': data.get('price_per_minute', 100),
@@ -2984,7 +2975,7 @@ def handle_node_heartbeat(data):
     
     if node_id and node_id in connected_nodes:
         nm = get_node_manager()
-        nm.redis.hset(f"node:{node_id}", 'last_ping', datetime.utcnow().timestamp())
+        nm.redis.hset(f"node:{node_id}", 'last_ping', time.time())
         emit('heartbeat_ack', {'timestamp': datetime.utcnow().isoformat() + 'Z'})
 
 
@@ -3052,28 +3043,37 @@ def get_websocket_node_for_model_id(model_id):
 # ============================================
 
 
+# Background job for pruning nodes that stopped sending heartbeats
+def sweep_offline_nodes():
+    """Remove stale nodes from the online set used for node selection."""
+    removed = get_node_manager().sweep_offline_nodes()
+    if removed:
+        logger.info(f"Marked {removed} nodes offline (no heartbeat)")
+
+
 # Background job for cleaning up expired sessions
 def cleanup_expired_sessions():
     """Clean up expired sessions."""
     with app.app_context():
-        expired = Session.query.filter(
-            Session.active == True,
-            Session.expires_at < datetime.utcnow()
-        ).all()
+        expired = Session.expired_query().all()
         
-        nm = get_node_manager()
+        to_stop = []
         for session in expired:
             current_app.logger.info(f"Cleaning up expired session {session.id}")
             
             # Stop session on node
             if session.node_id and session.node_id != 'pending':
-                try:
-                    nm.stop_remote_session(session.node_id, session.id)
-                except Exception as e:
-                    current_app.logger.error(f"Error stopping session on node: {e}")
+                to_stop.append((session.node_id, session.id))
             
             session.active = False
         
+        # Stop all sessions on their nodes concurrently
+        if to_stop:
+            try:
+                get_node_manager().stop_remote_sessions(to_stop)
+            except Exception as e:
+                current_app.logger.error(f"Error stopping sessions on nodes: {e}")
+        
         if expired:
             db.session.commit()
             current_app.logger.info(f"Cleaned up {len(expired)} expired sessions")
@@ -3089,6 +3089,10 @@ def start_cleanup_scheduler():
                 cleanup_expired_sessions()
             except Exception as e:
                 print(f"Cleanup error: {e}")
+            try:
+                sweep_offline_nodes()
+            except Exception as e:
+                print(f"Node sweep error: {e}")
             # Run every minute
             threading.Event().wait(60)
     
@@ -25,6 +25,27 @@ class Config:
     # Database
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'postgresql:///ailightning'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool. Pre-ping is off for PgBouncer (transaction mode) deployments:
+    # set DB_POOL_PRE_PING=true when connecting to PostgreSQL directly.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 60)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'false').lower() == 'true',
+    }
+    # QueuePool sizing: only for PostgreSQL (SQLite engines reject these options)
+    if SQLALCHEMY_DATABASE_URI.startswith('postgres'):
+        SQLALCHEMY_ENGINE_OPTIONS.update({
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        })
+
+    # Pooled HTTP client used for calls to node servers
+    NODE_HTTP_MAX_CONNECTIONS = int(os.environ.get('NODE_HTTP_MAX_CONNECTIONS', 256))
+    NODE_HTTP_MAX_KEEPALIVE = int(os.environ.get('NODE_HTTP_MAX_KEEPALIVE', 64))
+    # Concurrent stop_session calls when expired sessions are cleaned up
+    NODE_STOP_WORKERS = int(os.environ.get('NODE_STOP_WORKERS', 16))
+    # Seconds to buffer node heartbeats/earnings before one pipelined write (0 = off)
+    HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', 0))
 
     # Lightning Network
     LND_NETWORK = os.environ.get('LND_NETWORK', 'testnet')  # 'bitcoin' for mainnet
@@ -73,9 +94,12 @@ class Config:
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD', '')
     SMTP_FROM = os.environ.get('SMTP_FROM', 'noreply@lightphon.com')
     SMTP_USE_SSL = os.environ.get('SMTP_USE_SSL', 'true').lower() == 'true'
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', 4))  # Idle connections kept open
     
     # Alert thresholds
     DISK_CRITICAL_PERCENT = int(os.environ.get('DISK_CRITICAL_PERCENT', 90))  # Send email when disk > 90%
+    # Extra recipients (comma-separated) blind-copied on node alert emails
+    ALERT_CC_EMAILS = [e.strip() for e in os.environ.get('ALERT_CC_EMAILS', '').split(',') if e.strip()]
     
     # Node version settings
     MIN_NODE_VERSION = os.environ.get('MIN_NODE_VERSION', '1.0.0')  # Minimum node software version required
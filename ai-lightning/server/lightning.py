@@ -6,16 +6,38 @@ Uses REST API instead of gRPC to avoid protobuf compatibility issues.
 import os
 import base64
 import logging
-import requests
-import urllib3
 import hashlib
+import secrets
+import threading
 import time
-
-# Disable SSL warnings for self-signed certificates
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+import httpx
 
 logger = logging.getLogger(__name__)
 
+# How long a /v1/getinfo response is reused (seconds)
+INFO_CACHE_TTL = 2.0
+
+# HTTP/2 client shared by every LightningManager (single LND host -> one pool)
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client():
+    """Return the shared httpx.Client, creating it on first use."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                # Usa verify=False per certificati self-signed locali
+                # In produzione, usa verify=LND_CERT_PATH
+                _CLIENT = httpx.Client(
+                    http2=True,
+                    verify=False,
+                    timeout=30.0,
+                    limits=httpx.Limits(max_keepalive_connections=16, max_connections=32)
+                )
+    return _CLIENT
+
 
 class LightningManager:
     def __init__(self, config):
@@ -27,8 +49,10 @@ class LightningManager:
         """
         self.config = config
         self._macaroon = None
+        self._headers = None
         self._cert_path = None
         self._base_url = None
+        self._info_cache = (0.0, None)  # (monotonic fetch time, getinfo response)
         self._test_mode = config.get('TEST_MODE', 'false').lower() == 'true'
         
         if self._test_mode:
@@ -56,6 +80,11 @@ class LightningManager:
         try:
             with open(macaroon_path, 'rb') as f:
                 self._macaroon = f.read().hex()
+            # Pre-encoded once: header values are sent as-is on every request
+            self._headers = {
+                'Grpc-Metadata-macaroon': self._macaroon.encode('ascii'),
+                'Content-Type': 'application/json'
+            }
             logger.info(f"LND REST API configured: {self._base_url}")
         except FileNotFoundError:
             logger.warning(f"Macaroon not found at {macaroon_path}")
@@ -63,10 +92,7 @@ class LightningManager:
     
     def _get_headers(self):
         """Return headers for REST requests."""
-        return {
-            'Grpc-Metadata-macaroon': self._macaroon,
-            'Content-Type': 'application/json'
-        }
+        return self._headers
     
     def _request(self, method, endpoint, data=None):
         """Execute a REST request to LND."""
@@ -76,12 +102,11 @@ class LightningManager:
         url = f"{self._base_url}{endpoint}"
         
         try:
-            # Usa verify=False per certificati self-signed locali
-            # In produzione, usa verify=self._cert_path
+            client = _get_client()
             if method == 'GET':
-                response = requests.get(url, headers=self._get_headers(), verify=False, timeout=30)
+                response = client.get(url, headers=self._get_headers())
             elif method == 'POST':
-                response = requests.post(url, headers=self._get_headers(), json=data, verify=False, timeout=30)
+                response = client.post(url, headers=self._get_headers(), json=data)
             else:
                 raise ValueError(f"Unsupported method: {method}")
             
@@ -96,9 +121,9 @@ class LightningManager:
             
             return response.json()
             
-        except requests.exceptions.ConnectionError:
+        except httpx.ConnectError:
             raise Exception("Cannot connect to LND. Is it running?")
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             raise Exception("LND request timeout")
 
     def create_invoice(self, amount_sat, memo):
@@ -114,7 +139,7 @@ class LightningManager:
         """
         # TEST MODE: genera invoice fake che risulta sempre pagata
         if self._test_mode:
-            r_hash = hashlib.sha256(f"{memo}{time.time()}".encode()).hexdigest()
+            r_hash = secrets.token_hex(32)
             fake_invoice = f"lntb{amount_sat}test{r_hash[:20]}"
             logger.info(f"[TEST MODE] Created fake invoice: {r_hash[:16]}...")
             return {
@@ -134,11 +159,8 @@ class LightningManager:
         # r_hash is in base64, convert to hex for storage
         r_hash_b64 = response.get('r_hash', '')
         try:
-            # LND returns standard base64, may need padding
-            padding = 4 - len(r_hash_b64) % 4
-            if padding != 4:
-                r_hash_b64 += '=' * padding
-            r_hash_hex = base64.b64decode(r_hash_b64).hex() if r_hash_b64 else ''
+            # LND returns standard base64, possibly unpadded: b64decode ignores excess '='
+            r_hash_hex = base64.b64decode(r_hash_b64 + '===').hex() if r_hash_b64 else ''
         except Exception as e:
             logger.error(f"Error decoding r_hash: {e}, using raw value")
             r_hash_hex = r_hash_b64  # fallback to raw value
@@ -287,10 +309,19 @@ class LightningManager:
             return {'success': False, 'error': str(e)}
     
     def get_info(self):
-        """Get LND node information."""
+        """Get LND node information (cached for INFO_CACHE_TTL seconds)."""
         if self._test_mode:
             return {'alias': 'TEST_NODE', 'synced_to_chain': True, 'version': 'test'}
-        return self._request('GET', '/v1/getinfo')
+        fetched_at, info = self._info_cache
+        if info is not None and time.monotonic() - fetched_at < INFO_CACHE_TTL:
+            return info
+        return self.refresh_info()
+    
+    def refresh_info(self):
+        """Fetch LND node information bypassing the cache."""
+        info = self._request('GET', '/v1/getinfo')
+        self._info_cache = (time.monotonic(), info)
+        return info
     
     def get_balance(self):
         """Get wallet balance."""
@@ -307,5 +338,5 @@ class LightningManager:
             return False
     
     def close(self):
-        """Close the connection (no-op for REST)."""
-        pass
\ No newline at end of file
+        """Close the connection (REST is stateless, only drops cached info)."""
+        self._info_cache = (0.0, None)
\ No newline at end of file
@@ -4,11 +4,38 @@ Database models for the main server.
 Uses SQLAlchemy for PostgreSQL interaction.
 """
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import type_coerce
+from sqlalchemy.orm import load_only, lazyload
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 
 db = SQLAlchemy()
 
+# Argon2id password hashing (argon2-cffi releases the GIL while hashing)
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+
+class utcnow(FunctionElement):
+    """Current UTC time as a naive timestamp, computed by the database."""
+    type = db.DateTime()
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _default_utcnow(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utcnow, 'postgresql')
+def _pg_utcnow(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
 class User(db.Model):
     """System user."""
     __tablename__ = 'users'
@@ -18,21 +45,42 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)  # Required email
     password_hash = db.Column(db.String(256), nullable=False)  # Increased for scrypt hash
     balance = db.Column(db.Integer, default=0)  # Balance in satoshis
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow())
     is_admin = db.Column(db.Boolean, default=False)
     
     # Email verification
     email_verified = db.Column(db.Boolean, default=False)
     verification_token = db.Column(db.String(100), nullable=True)
     verification_token_expires = db.Column(db.DateTime, nullable=True)
+    
+    # Collections stay lazy: loading a User must not pull its whole history
+    sessions = db.relationship('Session', back_populates='user')
+    owned_nodes = db.relationship('Node', back_populates='owner')
+    transactions = db.relationship('Transaction', back_populates='user')
 
     def set_password(self, password):
         """Set the hashed password."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        """Verify the password."""
-        return check_password_hash(self.password_hash, password)
+        """
+        Verify the password.
+
+        Legacy werkzeug hashes (pbkdf2/scrypt) are still accepted and, on a
+        successful check, replaced with an argon2 hash: the caller commits it.
+        """
+        if not self.password_hash.startswith('$argon2'):
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -40,6 +88,12 @@ class User(db.Model):
 class Session(db.Model):
     """Active chat session."""
     __tablename__ = 'sessions'
+    __table_args__ = (
+        # Active sessions of a user
+        db.Index('ix_sessions_user_active', 'user_id', 'active'),
+        # Expiry sweeps only look at active sessions
+        db.Index('ix_sessions_active_expiry', 'expires_at', postgresql_where=db.text('active')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -49,38 +103,54 @@ class Session(db.Model):
     amount = db.Column(db.Integer, nullable=True)  # Amount in satoshis
     expires_at = db.Column(db.DateTime, nullable=False)
     active = db.Column(db.Boolean, default=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow())
     started_at = db.Column(db.DateTime, nullable=True)  # When node confirmed session ready
     ended_at = db.Column(db.DateTime, nullable=True)  # When session ended
     refunded = db.Column(db.Boolean, default=False)  # True if user was refunded
     refund_amount = db.Column(db.Integer, default=0)  # Amount refunded in satoshis
     context_length = db.Column(db.Integer, default=4096)  # Context length for the model
 
-    user = db.relationship('User', backref='sessions')
+    user = db.relationship('User', back_populates='sessions', lazy='selectin')
 
     @property
     def expired(self):
         """True if session is expired."""
         return datetime.utcnow() > self.expires_at
 
+    @classmethod
+    def expired_query(cls):
+        """Active sessions past their expiry, compared against the database clock."""
+        return cls.query.filter(cls.active == True, cls.expires_at < utcnow())
+
     def __repr__(self):
         return f'<Session {self.id} for {self.user.username}>'
 
 class Node(db.Model):
     """Registered host node."""
     __tablename__ = 'nodes'
+    __table_args__ = (
+        # Containment / key lookups on the offered models ("which nodes serve X")
+        db.Index('ix_nodes_models_gin', 'models', postgresql_using='gin'),
+        # Online nodes by recency of heartbeat
+        db.Index('ix_nodes_online_lastping', 'online', 'last_ping'),
+    )
 
     id = db.Column(db.String(64), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     address = db.Column(db.String(45), nullable=False)
-    models = db.Column(db.JSON, nullable=False)  # Dict of offered models
+    models = db.Column(db.JSON().with_variant(JSONB, 'postgresql'), nullable=False)  # Dict of offered models
     payment_address = db.Column(db.String(256), nullable=True)  # Lightning address (LNURL, BOLT12, or node pubkey)
     online = db.Column(db.Boolean, default=True)
     last_ping = db.Column(db.DateTime, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow())
     total_earned = db.Column(db.Integer, default=0)  # Total satoshis earned
 
-    owner = db.relationship('User', backref='owned_nodes')
+    owner = db.relationship('User', back_populates='owned_nodes', lazy='selectin')
+
+    @classmethod
+    def offering(cls, model_name):
+        """Query for nodes whose models include model_name (GIN-indexed on PostgreSQL)."""
+        return cls.query.filter(type_coerce(cls.models, JSONB).has_key(model_name))
 
     def __repr__(self):
         return f'<Node {self.id} at {self.address}>'
@@ -112,18 +182,18 @@ class NodeStats(db.Model):
     avg_response_time_ms = db.Column(db.Float, default=0.0)
     
     # Uptime
-    first_online = db.Column(db.DateTime, default=datetime.utcnow)
-    last_online = db.Column(db.DateTime, default=datetime.utcnow)
+    first_online = db.Column(db.DateTime, server_default=utcnow())
+    last_online = db.Column(db.DateTime, server_default=utcnow())
     total_uptime_hours = db.Column(db.Float, default=0.0)
     
     # Timestamps
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
 
     node = db.relationship('Node', backref=db.backref('stats', uselist=False))
     owner = db.relationship('User', backref=db.backref('owned_node_stats', lazy='dynamic'))
 
     def to_dict(self):
-        """Convert to dictionary for API."""
+        """Convert to dictionary for API (floats are left unrounded, clients format them)."""
         return {
             'node_id': self.node_id,
             'owner_user_id': self.owner_user_id,
@@ -132,13 +202,13 @@ class NodeStats(db.Model):
             'failed_sessions': self.failed_sessions,
             'total_requests': self.total_requests,
             'total_tokens_generated': self.total_tokens_generated,
-            'total_minutes_active': round(self.total_minutes_active, 2),
+            'total_minutes_active': self.total_minutes_active,
             'total_earned_sats': self.total_earned_sats,
-            'avg_tokens_per_second': round(self.avg_tokens_per_second, 2),
-            'avg_response_time_ms': round(self.avg_response_time_ms, 2),
+            'avg_tokens_per_second': self.avg_tokens_per_second,
+            'avg_response_time_ms': self.avg_response_time_ms,
             'first_online': self.first_online.isoformat() if self.first_online else None,
             'last_online': self.last_online.isoformat() if self.last_online else None,
-            'total_uptime_hours': round(self.total_uptime_hours, 2),
+            'total_uptime_hours': self.total_uptime_hours,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
 
@@ -146,6 +216,10 @@ class NodeStats(db.Model):
 class Transaction(db.Model):
     """Financial transaction."""
     __tablename__ = 'transactions'
+    __table_args__ = (
+        # Per-user history ordered by time
+        db.Index('ix_txn_user_time', 'user_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(20), nullable=False)  # 'deposit', 'withdrawal', 'session_payment', 'node_earning', 'commission'
@@ -157,10 +231,21 @@ class Transaction(db.Model):
     status = db.Column(db.String(20), default='pending')  # 'pending', 'completed', 'failed', 'expired'
     description = db.Column(db.String(200))
     reference_id = db.Column(db.String(64), nullable=True)  # ID sessione o altro riferimento
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow(), index=True)
     completed_at = db.Column(db.DateTime, nullable=True)
 
-    user = db.relationship('User', backref='transactions')
+    user = db.relationship('User', back_populates='transactions', lazy='selectin')
+    
+    @classmethod
+    def list_query(cls):
+        """Query that loads only the columns serialized by to_dict (plus user_id)."""
+        return cls.query.options(
+            load_only(
+                cls.id, cls.type, cls.user_id, cls.amount, cls.fee, cls.balance_after,
+                cls.status, cls.description, cls.created_at, cls.completed_at
+            ),
+            lazyload(cls.user)
+        )
     
     def to_dict(self):
         return {
@@ -186,7 +271,7 @@ class DepositInvoice(db.Model):
     payment_request = db.Column(db.Text, nullable=False)  # Invoice BOLT11
     amount = db.Column(db.Integer, nullable=False)  # Satoshis
     status = db.Column(db.String(20), default='pending')  # 'pending', 'paid', 'expired'
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, server_default=utcnow())
     expires_at = db.Column(db.DateTime, nullable=False)
     paid_at = db.Column(db.DateTime, nullable=True)
     
@@ -203,4 +288,4 @@ class PlatformStats(db.Model):
     total_users = db.Column(db.Integer, default=0)
     total_nodes = db.Column(db.Integer, default=0)
     total_volume = db.Column(db.Integer, default=0)  # Volume totale transazioni
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, server_default=utcnow(), onupdate=utcnow())
\ No newline at end of file
@@ -4,14 +4,77 @@ Host nodes management.
 Uses Redis for coordination and node selection.
 """
 import redis
-import json
+import orjson
 import uuid
 import logging
-from datetime import datetime
+import threading
+import time
 import httpx
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import insert, update
+from models import db, User, Transaction
 
 logger = logging.getLogger(__name__)
 
+# Seconds without heartbeat after which a node is considered offline
+NODE_PING_TIMEOUT = 30
+
+# Default headers for the orjson-encoded bodies sent to node servers
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+# Seconds a get_available_node result is reused for the same model
+SELECTION_CACHE_TTL = 0.25
+
+# Seconds a check_node_status result is reused for the same node
+STATUS_CACHE_TTL = 2.0
+
+# Heartbeat in one atomic round-trip: refresh ping/status of a known node
+# and make sure it is still listed in the registered and online sets.
+# When a load is reported it is stored and moved in the node's model indexes.
+# KEYS[1] = node hash, KEYS[2] = registered nodes set, KEYS[3] = online nodes set,
+# KEYS[4] = node models set
+# ARGV[1] = timestamp, ARGV[2] = node id, ARGV[3] = model index key prefix,
+# ARGV[4] = load (optional)
+# Returns 0 for an unknown node, 2 if the node was back online, 1 otherwise.
+HEARTBEAT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'last_ping', ARGV[1], 'status', 'online')
+if ARGV[4] then
+    redis.call('HSET', KEYS[1], 'load', ARGV[4])
+    for _, model in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+        redis.call('ZADD', ARGV[3] .. model, 'XX', ARGV[4], ARGV[2])
+    end
+end
+redis.call('SADD', KEYS[2], ARGV[2])
+return 1 + redis.call('SADD', KEYS[3], ARGV[2])
+"""
+
+# Node fields returned by selection and get_node (not the whole hash)
+NODE_SUMMARY_FIELDS = ('address', 'status', 'payment_address', 'load', 'models_ver')
+
+# Node selection in one round-trip: walk the model index by load (lowest
+# first) and return the id and summary fields of the first online node,
+# pruning nodes that went offline since the last sweep from the online set.
+# KEYS[1] = model index (sorted set), KEYS[2] = online nodes set
+# ARGV[1] = node hash key prefix, ARGV[2..] = fields to return
+SELECT_NODE_SCRIPT = """
+local ids = redis.call('ZRANGE', KEYS[1], 0, -1)
+for _, id in ipairs(ids) do
+    if redis.call('SISMEMBER', KEYS[2], id) == 1 then
+        local key = ARGV[1] .. id
+        if redis.call('HGET', key, 'status') == 'online' then
+            local node = redis.call('HMGET', key, unpack(ARGV, 2))
+            table.insert(node, 1, id)
+            return node
+        end
+        redis.call('SREM', KEYS[2], id)
+    end
+end
+return false
+"""
+
 class NodeManager:
     def __init__(self, config):
         """
@@ -21,12 +84,52 @@ class NodeManager:
             config: Flask config object or dict with Redis URL
         """
         self.config = config
+        # Statically configured models (name -> path/context), read once
+        self._models = config.get('AVAILABLE_MODELS', {})
         redis_url = config.get('REDIS_URL', 'redis://localhost:6379')
-        self.redis = redis.Redis.from_url(redis_url)
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
         self.active_sessions = {}  # session_id -> node_info
+        self._models_cache = {}  # node_id -> (models_ver, frozenset of model names)
+        self._selection_cache = {}  # model -> (expires_at, node_data or None)
+        self._selection_lock = threading.Lock()
+        self._status_cache = {}  # node_id -> (expires_at, online)
+        
+        # Optional coalescing of heartbeats and earnings, flushed in one pipeline
+        self._flush_interval = float(config.get('HEARTBEAT_FLUSH_INTERVAL', 0))
+        self._pending_lock = threading.Lock()
+        self._pending_heartbeats = {}  # node_id -> (timestamp, load or None)
+        self._pending_earnings = {}  # node_id -> sats
+        self._flush_stop = threading.Event()
+        if self._flush_interval > 0:
+            threading.Thread(target=self._flush_loop, daemon=True).start()
+        
+        # Pooled client for calls to node servers (keep-alive across requests)
+        # Bodies are pre-encoded with orjson and sent as content=
+        self.http = httpx.Client(
+            headers=JSON_HEADERS,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(
+                max_keepalive_connections=int(config.get('NODE_HTTP_MAX_KEEPALIVE', 64)),
+                max_connections=int(config.get('NODE_HTTP_MAX_CONNECTIONS', 256)),
+                keepalive_expiry=30.0
+            )
+        )
+        # Workers sending stop_session calls concurrently on that client
+        self._stop_executor = ThreadPoolExecutor(
+            max_workers=int(config.get('NODE_STOP_WORKERS', 16)),
+            thread_name_prefix='node-stop'
+        )
         
         # Set to track nodes (more efficient than KEYS)
         self.nodes_set_key = "registered_nodes"
+        # Nodes with a recent heartbeat (pruned by sweep_offline_nodes)
+        self.online_set_key = "online_nodes"
+        # Prefix for node hash keys built from set members in scan loops
+        self._node_key_prefix = "node:"
+        
+        # Registered once, then invoked via EVALSHA
+        self._heartbeat_script = self.redis.register_script(HEARTBEAT_SCRIPT)
+        self._select_node_script = self.redis.register_script(SELECT_NODE_SCRIPT)
 
     def register_node(self, user_id, address, models, payment_address=None):
         """
@@ -42,24 +145,214 @@ class NodeManager:
             str: Node ID
         """
         node_id = f"node-{uuid.uuid4().hex[:8]}"
-        self.redis.hset(
-            f"node:{node_id}",
-            mapping={
-                'id': node_id,
-                'user_id': user_id,
-                'address': address,
-                'models': json.dumps(models),
-                'status': 'online',
-                'last_ping': datetime.utcnow().timestamp(),
-                'load': 0,
-                'payment_address': payment_address or '',
-                'total_earned': 0
-            }
-        )
-        # Add to the registered nodes set (more efficient than KEYS)
-        self.redis.sadd(self.nodes_set_key, node_id)
+        # All registration writes in one MULTI/EXEC round-trip
+        with self.redis.pipeline() as pipe:
+            pipe.hset(
+                f"node:{node_id}",
+                mapping={
+                    'id': node_id,
+                    'user_id': user_id,
+                    'address': address,
+                    'models': orjson.dumps(models),
+                    'models_ver': 1,  # Bump whenever 'models' is rewritten
+                    'status': 'online',
+                    'last_ping': time.time(),
+                    'load': 0,
+                    'payment_address': payment_address or '',
+                    'total_earned': 0
+                }
+            )
+            # Add to the registered nodes set (more efficient than KEYS)
+            pipe.sadd(self.nodes_set_key, node_id)
+            pipe.sadd(self.online_set_key, node_id)
+            # Index the node under each offered model, scored by load
+            for model_name in models:
+                pipe.zadd(self._model_index_key(model_name), {node_id: 0})
+            if models:
+                pipe.sadd(self._node_models_key(node_id), *models)
+            pipe.execute()
+        self._models_cache[node_id] = ('1', frozenset(models))
+        self._invalidate_selection(models)
         return node_id
 
+    @staticmethod
+    def _model_index_key(model):
+        """Key of the sorted set of nodes offering a model, scored by load."""
+        return f"model_nodes:{model}"
+
+    @staticmethod
+    def _node_models_key(node_id):
+        """Key of the set of model names offered by a node."""
+        return f"node_models:{node_id}"
+
+    def backfill_model_index(self):
+        """
+        Index nodes registered before the per-model sorted sets existed.
+
+        Rebuilds each node's model set and its model_nodes:<model> entries
+        (scored by its current load) from the node hash, and lists online
+        nodes in the online set. Idempotent: existing scores are kept.
+        Only HTTP nodes are indexed: WebSocket nodes and hashes with
+        malformed models or load are skipped.
+
+        Returns:
+            int: Number of nodes indexed
+        """
+        indexed = 0
+        pipe = self.redis.pipeline(transaction=False)
+        for node_id, node_data in self._fetch_all_nodes():
+            # WebSocket nodes (type 'websocket', no HTTP address) are served
+            # from connected_nodes and never selected from the model indexes
+            if (not node_data or not node_data.get('address')
+                    or node_data.get('type') == 'websocket'):
+                continue
+            try:
+                models = orjson.loads(node_data.get('models') or '{}')
+                load = float(node_data.get('load') or 0)
+            except (orjson.JSONDecodeError, ValueError):
+                models = None
+            if not isinstance(models, dict):
+                logger.warning(f"Not indexing node {node_id}: malformed models or load")
+                continue
+            if not models:
+                continue
+            for model_name in models:
+                pipe.zadd(self._model_index_key(model_name), {node_id: load}, nx=True)
+            pipe.sadd(self._node_models_key(node_id), *models)
+            pipe.hsetnx(f"node:{node_id}", 'models_ver', 1)
+            if node_data.get('status') == 'online':
+                pipe.sadd(self.online_set_key, node_id)
+            indexed += 1
+        if indexed:
+            pipe.execute()
+        return indexed
+
+    def _node_models(self, node_id, node_data):
+        """
+        Model names offered by a node, parsed once per models_ver.
+
+        Args:
+            node_id: Node ID
+            node_data: Node hash
+
+        Returns:
+            frozenset: Model names
+        """
+        models_ver = node_data.get('models_ver')
+        cached = self._models_cache.get(node_id)
+        if cached and models_ver is not None and cached[0] == models_ver:
+            return cached[1]
+        if 'models' not in node_data:
+            # Summary from get_node/selection: read the node's model set
+            return self._get_node_models(node_id) or frozenset()
+        models = frozenset(orjson.loads(node_data['models'] or '{}'))
+        if models_ver is not None:
+            self._models_cache[node_id] = (models_ver, models)
+        return models
+
+    def _get_node_models(self, node_id):
+        """
+        Model names offered by a node, fetching only models_ver on a cache hit.
+
+        Args:
+            node_id: Node ID
+
+        Returns:
+            frozenset: Model names, or None if the node does not exist
+        """
+        cached = self._models_cache.get(node_id)
+        if cached and self.redis.hget(f"node:{node_id}", 'models_ver') == cached[0]:
+            return cached[1]
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hget(f"node:{node_id}", 'models_ver')
+        pipe.smembers(self._node_models_key(node_id))
+        models_ver, names = pipe.execute()
+        if models_ver is None:
+            # Not registered through register_node (or gone): parse the hash
+            node_data = self.redis.hgetall(f"node:{node_id}")
+            if not node_data:
+                self._models_cache.pop(node_id, None)
+                return None
+            return frozenset(orjson.loads(node_data.get('models') or '{}'))
+        models = frozenset(names)
+        self._models_cache[node_id] = (models_ver, models)
+        return models
+
+    def node_supports_model(self, node_id, model):
+        """
+        Check whether a node offers a model, without fetching its hash.
+
+        Args:
+            node_id: Node ID
+            model: Model name
+
+        Returns:
+            bool: True if the node offers the model
+        """
+        return bool(self.redis.sismember(self._node_models_key(node_id), model))
+
+    def _adjust_load(self, node_id, node_data, delta):
+        """
+        Change a node's load in its hash and in every model index.
+
+        Args:
+            node_id: Node ID
+            node_data: Node hash (for the list of models)
+            delta: Load increment (negative to decrement)
+        """
+        models = self._node_models(node_id, node_data)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(f"node:{node_id}", 'load', delta)
+        for model_name in models:
+            pipe.zincrby(self._model_index_key(model_name), delta, node_id)
+        pipe.execute()
+        self._invalidate_selection(models)
+
+    def update_load(self, node_id, load):
+        """
+        Set a node's load as reported by the node itself.
+
+        Args:
+            node_id: Node ID
+            load: Current load
+        """
+        models = self._get_node_models(node_id)
+        if models is None:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(f"node:{node_id}", 'load', load)
+        for model_name in models:
+            pipe.zadd(self._model_index_key(model_name), {node_id: load}, xx=True)
+        pipe.execute()
+        self._invalidate_selection(models)
+
+    def _invalidate_selection(self, models):
+        """
+        Drop cached get_available_node results for the given models.
+
+        Args:
+            models: Model names whose candidate ordering may have changed
+        """
+        with self._selection_lock:
+            for model_name in models:
+                self._selection_cache.pop(model_name, None)
+
+    def _fetch_all_nodes(self):
+        """
+        Fetch the hash of every registered node in a single round-trip.
+
+        Returns:
+            list: (node_id, node_data) pairs; node_data is empty for stale ids
+        """
+        node_ids = list(self.redis.smembers(self.nodes_set_key))
+        if not node_ids:
+            return []
+        pipe = self.redis.pipeline(transaction=False)
+        prefix = self._node_key_prefix
+        for node_id in node_ids:
+            pipe.hgetall(prefix + node_id)
+        return list(zip(node_ids, pipe.execute()))
+
     def get_available_node(self, model):
         """
         Find an available node that supports the model.
@@ -70,33 +363,62 @@ class NodeManager:
         Returns:
             dict: Node information, or None
         """
-        best_node = None
-        best_score = float('-inf')
+        # Bursts of session starts for the same model share one lookup;
+        # load changes through this manager invalidate the entry
+        now = time.monotonic()
+        with self._selection_lock:
+            cached = self._selection_cache.get(model)
+        if cached and cached[0] > now:
+            return dict(cached[1]) if cached[1] is not None else None
 
-        # Use SMEMBERS instead of KEYS for better performance
-        for node_id in self.redis.smembers(self.nodes_set_key):
-            node_id_str = node_id.decode() if isinstance(node_id, bytes) else node_id
-            node_data = self.redis.hgetall(f"node:{node_id_str}")
-            if not node_data:
-                continue
-            if (node_data.get(b'status', b'').decode() == 'online' and
-                model in json.loads(node_data.get(b'models', b'{}').decode())):
-                # Select node with lowest load
-                load = int(node_data.get(b'load', b'0'))
-                score = 1 / (load + 1)
-                if score > best_score:
-                    best_score = score
-                    best_node = node_data
-                    best_node[b'id'] = node_id  # Ensure the ID is present
+        node_data = self._select_node(model)
+        with self._selection_lock:
+            self._selection_cache[model] = (now + SELECTION_CACHE_TTL, node_data)
+        return dict(node_data) if node_data is not None else None
+
+    def _select_node(self, model):
+        """
+        Query Redis for the least loaded online node offering a model.
 
-        return best_node
+        Args:
+            model: Model name
 
-    def start_remote_session(self, node_id, session_id, model, context):
+        Returns:
+            dict: Node information, or None
         """
-        Start a session on a remote node.
+        reply = self._select_node_script(
+            keys=[self._model_index_key(model), self.online_set_key],
+            args=[self._node_key_prefix, *NODE_SUMMARY_FIELDS]
+        )
+        if not reply:
+            return None
+        node_data = dict(zip(NODE_SUMMARY_FIELDS, reply[1:]))
+        node_data['id'] = reply[0]
+        return node_data
+
+    def get_node(self, node_id):
+        """
+        Fetch the fields needed to use a node, without the whole hash.
 
         Args:
             node_id: Node ID
+
+        Returns:
+            dict: NODE_SUMMARY_FIELDS plus 'id', or None if the node does not exist
+        """
+        values = self.redis.hmget(f"node:{node_id}", NODE_SUMMARY_FIELDS)
+        if values[0] is None:
+            return None
+        node_data = dict(zip(NODE_SUMMARY_FIELDS, values))
+        node_data['id'] = node_id
+        return node_data
+
+    def start_remote_session(self, node, session_id, model, context):
+        """
+        Start a session on a remote node.
+
+        Args:
+            node: Node fields as returned by get_available_node or get_node
             session_id: Session ID
             model: Model name
             context: Context (n_tokens)
@@ -104,32 +426,30 @@ class NodeManager:
         Returns:
             dict: Session information
         """
-        node = self.redis.hgetall(f"node:{node_id}")
-        if not node or node.get(b'status', b'').decode() != 'online':
-            raise Exception("Node not available")
+        node_id = node['id']
 
         # Get model path from config
-        available_models = self.config.get('AVAILABLE_MODELS', {})
-        if model not in available_models:
+        model_info = self._models.get(model)
+        if model_info is None:
             raise Exception(f"Model {model} not configured")
         
-        llama_bin = available_models[model].get('path', '')
+        llama_bin = model_info.get('path', '')
 
         # Call to node server
-        response = httpx.post(
-            f"http://{node[b'address'].decode()}:9000/api/start_session",
-            json={
+        response = self.http.post(
+            f"http://{node['address']}:9000/api/start_session",
+            content=orjson.dumps({
                 'session_id': session_id,
                 'model': model,
                 'context': context,
                 'llama_bin': llama_bin
-            },
+            }),
             timeout=120  # llama.cpp can take time to start
         )
         response.raise_for_status()
         
         # Increment node load
-        self.redis.hincrby(f"node:{node_id}", 'load', 1)
+        self._adjust_load(node_id, node, 1)
         
         result = response.json()
         
@@ -137,25 +457,134 @@ class NodeManager:
         self.active_sessions[str(session_id)] = {
             'node_id': node_id,
             'port': result.get('port'),
-            'started_at': datetime.utcnow().timestamp()
+            'started_at': time.time()
         }
         
         return result
 
-    def node_heartbeat(self, node_id):
+    def start_remote_session_by_id(self, node_id, session_id, model, context):
         """
-        Update node status.
+        Start a session on a node known only by its ID.
 
         Args:
             node_id: Node ID
+            session_id: Session ID
+            model: Model name
+            context: Context (n_tokens)
+
+        Returns:
+            dict: Session information
         """
-        self.redis.hset(
-            f"node:{node_id}",
-            {
-                'last_ping': datetime.utcnow().timestamp(),
-                'status': 'online'
-            }
-        )
+        node = self.get_node(node_id)
+        if not node or node['status'] != 'online':
+            raise Exception("Node not available")
+        return self.start_remote_session(node, session_id, model, context)
+
+    def node_heartbeat(self, node_id, load=None):
+        """
+        Update node status, and its load if reported.
+
+        With HEARTBEAT_FLUSH_INTERVAL set, the heartbeat is buffered (the
+        latest one per node wins) and written by the next flush.
+
+        Args:
+            node_id: Node ID
+            load: Current load reported by the node (optional)
+
+        Returns:
+            bool: False if the node is not registered (always True when buffered)
+        """
+        timestamp = time.time()
+        if load is not None:
+            try:
+                load = int(float(load))  # Nodes may report 0.5 or "12"
+            except (TypeError, ValueError):
+                logger.debug(f"Ignoring invalid load from node {node_id}: {load!r}")
+                load = None
+        if self._flush_interval > 0:
+            with self._pending_lock:
+                previous = self._pending_heartbeats.get(node_id)
+                if load is None and previous:
+                    load = previous[1]
+                self._pending_heartbeats[node_id] = (timestamp, load)
+            return True
+        return self._write_heartbeats([(node_id, timestamp, load)])[0]
+
+    def _write_heartbeats(self, heartbeats, pipe=None):
+        """
+        Run the heartbeat script for each node, in one pipeline.
+
+        Args:
+            heartbeats: List of (node_id, timestamp, load or None)
+            pipe: Pipeline to queue on (executed by the caller), or None
+
+        Returns:
+            list: Registration flags, or None if queued on a caller's pipeline
+        """
+        own_pipe = pipe is None
+        if own_pipe:
+            pipe = self.redis.pipeline(transaction=False)
+        for node_id, timestamp, load in heartbeats:
+            args = [timestamp, node_id, self._model_index_key('')]
+            if load is not None:
+                args.append(load)
+            self._heartbeat_script(
+                keys=[
+                    f"node:{node_id}", self.nodes_set_key, self.online_set_key,
+                    self._node_models_key(node_id)
+                ],
+                args=args,
+                client=pipe
+            )
+        if not own_pipe:
+            return None
+        return self._heartbeats_written(heartbeats, pipe.execute())
+
+    def _heartbeats_written(self, heartbeats, results):
+        """Refresh local caches after heartbeat script results come back."""
+        registered = []
+        for (node_id, _, load), result in zip(heartbeats, results):
+            self._status_cache.pop(node_id, None)
+            if result == 2:
+                # Back online: it may now be the best candidate for its models
+                self._invalidate_selection(self._get_node_models(node_id) or ())
+            elif result and load is not None:
+                cached = self._models_cache.get(node_id)
+                self._invalidate_selection(cached[1] if cached else ())
+            registered.append(bool(result))
+        return registered
+
+    def _add_earnings(self, node_id, amount):
+        """Increment a node's total_earned, buffered like heartbeats if enabled."""
+        if self._flush_interval > 0:
+            with self._pending_lock:
+                self._pending_earnings[node_id] = self._pending_earnings.get(node_id, 0) + amount
+            return
+        self.redis.hincrby(f"node:{node_id}", 'total_earned', amount)
+
+    def flush(self):
+        """Write buffered heartbeats and earnings in a single pipeline."""
+        with self._pending_lock:
+            heartbeats, self._pending_heartbeats = self._pending_heartbeats, {}
+            earnings, self._pending_earnings = self._pending_earnings, {}
+        if not heartbeats and not earnings:
+            return
+        
+        heartbeats = [(node_id, ts, load) for node_id, (ts, load) in heartbeats.items()]
+        pipe = self.redis.pipeline(transaction=False)
+        self._write_heartbeats(heartbeats, pipe)
+        for node_id, amount in earnings.items():
+            pipe.hincrby(f"node:{node_id}", 'total_earned', amount)
+        results = pipe.execute()
+        self._heartbeats_written(heartbeats, results[:len(heartbeats)])
+
+    def _flush_loop(self):
+        """Background flusher for buffered heartbeats and earnings."""
+        while not self._flush_stop.wait(self._flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing node updates: {e}")
 
     def check_node_status(self, node_id):
         """
@@ -167,22 +596,75 @@ class NodeManager:
         Returns:
             bool: True if online
         """
-        node_data = self.redis.hgetall(f"node:{node_id}")
-        if not node_data:
-            return False
+        now = time.monotonic()
+        cached = self._status_cache.get(node_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        # Only the ping time is needed, not the whole hash
+        last_ping = self.redis.hget(f"node:{node_id}", 'last_ping')
+        online = (
+            last_ping is not None
+            and (time.time() - float(last_ping)) < NODE_PING_TIMEOUT
+        )
+        self._status_cache[node_id] = (now + STATUS_CACHE_TTL, online)
+        return online
+
+    def sweep_offline_nodes(self):
+        """
+        Drop nodes without a recent heartbeat from the online set.
+
+        Returns:
+            int: Number of nodes removed
+        """
+        node_ids = list(self.redis.smembers(self.online_set_key))
+        if not node_ids:
+            return 0
 
-        last_ping = node_data[b'last_ping']
-        return (datetime.utcnow().timestamp() - float(last_ping)) < 30  # 30 sec timeout
+        pipe = self.redis.pipeline(transaction=False)
+        prefix = self._node_key_prefix
+        for node_id in node_ids:
+            pipe.hget(prefix + node_id, 'last_ping')
+        last_pings = pipe.execute()
+
+        now = time.time()
+        stale = [
+            node_id for node_id, last_ping in zip(node_ids, last_pings)
+            if last_ping is None or now - float(last_ping) >= NODE_PING_TIMEOUT
+        ]
+        if stale:
+            self.redis.srem(self.online_set_key, *stale)
+            with self._selection_lock:
+                self._selection_cache.clear()
+        return len(stale)
 
     def get_all_nodes(self):
         """List all registered nodes."""
-        nodes = []
-        for node_id in self.redis.smembers(self.nodes_set_key):
-            node_id_str = node_id.decode() if isinstance(node_id, bytes) else node_id
-            node_data = self.redis.hgetall(f"node:{node_id_str}")
-            if node_data:
-                nodes.append(node_data)
-        return nodes
+        return [node_data for _, node_data in self._fetch_all_nodes() if node_data]
+
+    def iter_nodes(self, batch_size=500):
+        """
+        Yield every registered node hash, one pipeline per batch.
+
+        Args:
+            batch_size: Number of node hashes fetched per round-trip
+
+        Yields:
+            dict: Node fields
+        """
+        node_ids = list(self.redis.smembers(self.nodes_set_key))
+        prefix = self._node_key_prefix
+        for start in range(0, len(node_ids), batch_size):
+            pipe = self.redis.pipeline(transaction=False)
+            for node_id in node_ids[start:start + batch_size]:
+                pipe.hgetall(prefix + node_id)
+            for node_data in pipe.execute():
+                if node_data:
+                    yield node_data
+
+    def count_nodes(self):
+        """Number of registered nodes (SCARD, nothing is fetched)."""
+        return self.redis.scard(self.nodes_set_key)
     
     def unregister_node(self, node_id):
         """
@@ -191,8 +673,15 @@ class NodeManager:
         Args:
             node_id: Node ID
         """
-        self.redis.delete(f"node:{node_id}")
+        models = self._get_node_models(node_id) or ()
+        for model_name in models:
+            self.redis.zrem(self._model_index_key(model_name), node_id)
+        self._invalidate_selection(models)
+        self._models_cache.pop(node_id, None)
+        self._status_cache.pop(node_id, None)
+        self.redis.delete(f"node:{node_id}", self._node_models_key(node_id))
         self.redis.srem(self.nodes_set_key, node_id)
+        self.redis.srem(self.online_set_key, node_id)
     
     def stop_remote_session(self, node_id, session_id):
         """
@@ -202,23 +691,72 @@ class NodeManager:
             node_id: Node ID
             session_id: Session ID
         """
-        node = self.redis.hgetall(f"node:{node_id}")
-        if not node:
+        # Address to call; the models for the load update come from the
+        # models_ver cache (or the node's model set), not the JSON blob
+        address, models_ver = self.redis.hmget(f"node:{node_id}", 'address', 'models_ver')
+        if address is None:
             return
+        node = {'models_ver': models_ver}
         
         try:
-            response = httpx.post(
-                f"http://{node[b'address'].decode()}:9000/api/stop_session",
-                json={'session_id': session_id},
-                timeout=5
-            )
-            response.raise_for_status()
+            self._post_stop_session(address, session_id)
             
             # Decrementa il carico del nodo
-            self.redis.hincrby(f"node:{node_id}", 'load', -1)
+            self._adjust_load(node_id, node, -1)
         except Exception as e:
             logger.error(f"Error stopping session on node {node_id}: {e}")
 
+    def stop_remote_sessions(self, targets):
+        """
+        Stop many sessions on remote nodes concurrently.
+        
+        Args:
+            targets: List of (node_id, session_id) pairs
+        
+        Returns:
+            int: Number of sessions stopped
+        """
+        if not targets:
+            return 0
+        
+        # Node hashes for every target in one round-trip
+        pipe = self.redis.pipeline(transaction=False)
+        for node_id, _ in targets:
+            pipe.hgetall(f"node:{node_id}")
+        nodes = pipe.execute()
+        
+        jobs = [
+            (node_id, session_id, node)
+            for (node_id, session_id), node in zip(targets, nodes)
+            if node.get('address')
+        ]
+        # Requests overlap on the worker pool and share the pooled client
+        futures = [
+            self._stop_executor.submit(self._post_stop_session, node['address'], session_id)
+            for _, session_id, node in jobs
+        ]
+        
+        stopped = 0
+        for (node_id, session_id, node), future in zip(jobs, futures):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Error stopping session {session_id} on node {node_id}: {e}")
+                continue
+            # Decrementa il carico del nodo
+            self._adjust_load(node_id, node, -1)
+            stopped += 1
+        return stopped
+
+    def _post_stop_session(self, address, session_id):
+        """Ask a node server to stop a session (raises on HTTP errors)."""
+        response = self.http.post(
+            f"http://{address}:9000/api/stop_session",
+            content=orjson.dumps({'session_id': session_id}),
+            timeout=5
+        )
+        response.raise_for_status()
+
     def pay_node(self, node_id, amount, description, lightning_manager=None):
         """
         Pay a node for a session.
@@ -237,15 +775,15 @@ class NodeManager:
         Returns:
             dict: {'success': bool, 'method': 'lightning'|'balance', 'error': str|None}
         """
-        node_data = self.redis.hgetall(f"node:{node_id}")
-        if not node_data:
+        user_id, payment_address, node_address = self.redis.hmget(
+            f"node:{node_id}", 'user_id', 'payment_address', 'address'
+        )
+        if user_id is None:
             return {'success': False, 'method': None, 'error': 'Node not found'}
         
-        user_id = int(node_data[b'user_id'])
-        payment_address = node_data.get(b'payment_address', b'').decode()
+        user_id = int(user_id)
+        payment_address = payment_address or ''
 
-        from models import db, User, Transaction
-        
         # If has a Lightning address, try to pay directly
         if payment_address and lightning_manager:
             try:
@@ -256,13 +794,11 @@ class NodeManager:
                 
                 # For now, we assume the node generates an invoice via callback
                 # Ask the node to generate an invoice for the amount
-                node_address = node_data[b'address'].decode()
-                
                 try:
                     # Request invoice from node
-                    invoice_response = httpx.post(
+                    invoice_response = self.http.post(
                         f"http://{node_address}:9000/api/create_invoice",
-                        json={'amount': amount, 'description': description},
+                        content=orjson.dumps({'amount': amount, 'description': description}),
                         timeout=10
                     )
                     
@@ -276,16 +812,16 @@ class NodeManager:
                             
                             if pay_result.get('success'):
                                 # Update node earnings
-                                self.redis.hincrby(f"node:{node_id}", 'total_earned', amount)
+                                self._add_earnings(node_id, amount)
                                 
                                 # Record transaction
-                                with db.session.begin():
-                                    db.session.add(Transaction(
-                                        type='node_payment',
-                                        user_id=user_id,
-                                        amount=amount,
-                                        description=f"Lightning payment: {description}"
-                                    ))
+                                db.session.execute(insert(Transaction).values(
+                                    type='node_payment',
+                                    user_id=user_id,
+                                    amount=amount,
+                                    description=f"Lightning payment: {description}"
+                                ))
+                                db.session.commit()
                                 
                                 logger.info(f"Paid {amount} sats to node {node_id} via Lightning")
                                 return {'success': True, 'method': 'lightning', 'error': None}
@@ -302,24 +838,34 @@ class NodeManager:
         
         # Fallback: credit user balance
         try:
-            with db.session.begin():
-                owner = User.query.get(user_id)
-                if owner:
-                    owner.balance += amount
-
-                    db.session.add(Transaction(
-                        type='node_earning',
-                        user_id=user_id,
-                        amount=amount,
-                        description=description
-                    ))
-                    
-                    # Update node earnings
-                    self.redis.hincrby(f"node:{node_id}", 'total_earned', amount)
+            # Atomic increment in SQL: no SELECT of the owner row
+            credited = db.session.execute(
+                update(User).where(User.id == user_id).values(balance=User.balance + amount)
+            ).rowcount
+            if credited:
+                db.session.execute(insert(Transaction).values(
+                    type='node_earning',
+                    user_id=user_id,
+                    amount=amount,
+                    description=description
+                ))
+            db.session.commit()
+            
+            if credited:
+                # Update node earnings
+                self._add_earnings(node_id, amount)
             
             logger.info(f"Credited {amount} sats to node {node_id} owner balance")
             return {'success': True, 'method': 'balance', 'error': None}
             
         except Exception as e:
+            db.session.rollback()
             logger.error(f"Failed to credit node owner: {e}")
-            return {'success': False, 'method': None, 'error': str(e)}
\ No newline at end of file
+            return {'success': False, 'method': None, 'error': str(e)}
+
+    def close(self):
+        """Flush buffered node updates and close the pooled HTTP client."""
+        self._flush_stop.set()
+        self.flush()
+        self._stop_executor.shutdown(wait=True)
+        self.http.close()
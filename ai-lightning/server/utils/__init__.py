@@ -2,8 +2,12 @@
 Utility modules for AI Lightning server.
 """
 from .helpers import validate_model, get_model_price, format_satoshis
-from .decorators import rate_limit, validate_json, validate_model_param, admin_required
+from .decorators import (
+    rate_limit, validate_json, validate_model_param, admin_required,
+    is_admin_user,
+)
 from .logging import setup_logging, get_logger, RequestLogger
+from .json_provider import ORJSONProvider
 
 __all__ = [
     'validate_model',
@@ -13,7 +17,9 @@ __all__ = [
     'validate_json',
     'validate_model_param',
     'admin_required',
+    'is_admin_user',
     'setup_logging',
     'get_logger',
     'RequestLogger',
+    'ORJSONProvider',
 ]
\ No newline at end of file
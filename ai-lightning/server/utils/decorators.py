@@ -6,17 +6,116 @@ Rate limiting, validation, and other utilities.
 from functools import wraps
 from flask import request, jsonify, current_app
 import time
+import logging
 import threading
+from collections import OrderedDict, deque
+import redis
+from models import User
 
-# In-memory rate limiter (per production, usare Redis)
-_rate_limit_store = {}
-_rate_limit_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+# Redis client shared by all rate-limited endpoints (created on first use)
+_rate_limit_redis = None
+# After a Redis error, seconds spent on the in-memory store before retrying
+_REDIS_RETRY_INTERVAL = 5
+_redis_retry_at = 0.0  # time.time() before which Redis is not retried
+_redis_down = False  # Outage already logged
+
+# In-memory fallback when Redis is not configured or unreachable,
+# split into lock stripes so unrelated clients do not contend
+_RATE_LIMIT_SHARDS = 64
+_rate_limit_stores = [{} for _ in range(_RATE_LIMIT_SHARDS)]
+_rate_limit_locks = [threading.Lock() for _ in range(_RATE_LIMIT_SHARDS)]
+
+
+def _get_rate_limit_redis():
+    """Redis client for rate limiting, or None if REDIS_URL is not set."""
+    global _rate_limit_redis
+    if _rate_limit_redis is None:
+        redis_url = current_app.config.get('REDIS_URL')
+        if not redis_url:
+            return None
+        _rate_limit_redis = redis.Redis.from_url(redis_url)
+    return _rate_limit_redis
+
+
+def _redis_limit_exceeded(client, key, max_requests, window_seconds, current_time):
+    """
+    Sliding-window counter: one counter per fixed window, with the previous
+    window weighted by how much of it still overlaps the sliding window.
+    
+    Like the in-memory store, only allowed requests count: a rejected one
+    gives its increment back.
+    """
+    window = int(current_time // window_seconds)
+    current_key = f"rl:{key}:{window}"
+    pipe = client.pipeline(transaction=False)
+    pipe.incr(current_key)
+    pipe.expire(current_key, window_seconds * 2)
+    pipe.get(f"rl:{key}:{window - 1}")
+    count, _, previous = pipe.execute()
+    
+    overlap = 1 - (current_time % window_seconds) / window_seconds
+    if int(previous or 0) * overlap + count > max_requests:
+        client.decr(current_key)
+        return True
+    return False
+
+
+def _redis_limit_check(client, key, max_requests, window_seconds, current_time):
+    """
+    Run the Redis limiter, or return None while Redis is unreachable.
+    
+    After an error Redis is left alone for _REDIS_RETRY_INTERVAL seconds,
+    and each outage is logged once rather than on every request.
+    """
+    global _redis_retry_at, _redis_down
+    if current_time < _redis_retry_at:
+        return None
+    try:
+        exceeded = _redis_limit_exceeded(
+            client, key, max_requests, window_seconds, current_time
+        )
+    except redis.RedisError as e:
+        _redis_retry_at = current_time + _REDIS_RETRY_INTERVAL
+        if not _redis_down:
+            _redis_down = True
+            logger.warning(f"Rate limit falling back to memory until Redis is back: {e}")
+        return None
+    if _redis_down:
+        _redis_down = False
+        logger.info("Rate limit back on Redis")
+    return exceeded
+
+
+def _memory_limit_exceeded(key, max_requests, window_seconds, current_time):
+    """In-process limiter, per worker."""
+    shard = hash(key) % _RATE_LIMIT_SHARDS
+    with _rate_limit_locks[shard]:
+        timestamps = _rate_limit_stores[shard].get(key)
+        if timestamps is None:
+            timestamps = _rate_limit_stores[shard][key] = deque()
+        
+        # Rimuovi richieste fuori dalla finestra (le piu' vecchie sono in testa)
+        while timestamps and current_time - timestamps[0] >= window_seconds:
+            timestamps.popleft()
+        
+        # Controlla se siamo sopra il limite
+        if len(timestamps) >= max_requests:
+            return True
+        
+        # Registra la richiesta
+        timestamps.append(current_time)
+    return False
 
 
 def rate_limit(max_requests: int = 60, window_seconds: int = 60):
     """
     Rate limiting decorator.
     
+    Counts are kept in Redis (shared by all workers), falling back to an
+    in-process store when Redis is not available.
+    
     Args:
         max_requests: Numero massimo di richieste nella finestra
         window_seconds: Durata della finestra in secondi
@@ -36,25 +135,22 @@ def rate_limit(max_requests: int = 60, window_seconds: int = 60):
             key = f"{f.__name__}:{client_id}"
             current_time = time.time()
             
-            with _rate_limit_lock:
-                if key not in _rate_limit_store:
-                    _rate_limit_store[key] = []
-                
-                # Rimuovi richieste fuori dalla finestra
-                _rate_limit_store[key] = [
-                    t for t in _rate_limit_store[key]
-                    if current_time - t < window_seconds
-                ]
-                
-                # Controlla se siamo sopra il limite
-                if len(_rate_limit_store[key]) >= max_requests:
-                    return jsonify({
-                        'error': 'Rate limit exceeded',
-                        'retry_after': window_seconds
-                    }), 429
-                
-                # Registra la richiesta
-                _rate_limit_store[key].append(current_time)
+            exceeded = None
+            client = _get_rate_limit_redis()
+            if client is not None:
+                exceeded = _redis_limit_check(
+                    client, key, max_requests, window_seconds, current_time
+                )
+            if exceeded is None:
+                exceeded = _memory_limit_exceeded(
+                    key, max_requests, window_seconds, current_time
+                )
+            
+            if exceeded:
+                return jsonify({
+                    'error': 'Rate limit exceeded',
+                    'retry_after': window_seconds
+                }), 429
             
             return f(*args, **kwargs)
         return decorated_function
@@ -119,6 +215,47 @@ def validate_model_param(f):
     return decorated_function
 
 
+# Seconds an is_admin lookup is reused. Admin rights are only granted outside
+# the server process (flask create-admin, scripts/create_admin.py), which
+# cannot reach this cache: a change takes effect within this delay
+ADMIN_CACHE_TTL = 60
+# Cap on cached users; the oldest entries are dropped first
+ADMIN_CACHE_MAX_ENTRIES = 10000
+
+# user_id -> (expires_at, is_admin), oldest first
+_admin_cache = OrderedDict()
+_admin_cache_lock = threading.Lock()
+
+
+def is_admin_user(user_id) -> bool:
+    """
+    Check whether a user is an admin, caching the answer for ADMIN_CACHE_TTL.
+    
+    Args:
+        user_id: User ID (JWT identity, str or int)
+    """
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _admin_cache_lock:
+        cached = _admin_cache.get(user_id)
+    if cached and cached[0] > now:
+        return cached[1]
+    
+    is_admin = bool(
+        User.query.with_entities(User.is_admin).filter_by(id=user_id).scalar()
+    )
+    with _admin_cache_lock:
+        _admin_cache[user_id] = (now + ADMIN_CACHE_TTL, is_admin)
+        _admin_cache.move_to_end(user_id)
+        # Entries share one TTL, so the expired ones are at the front
+        while _admin_cache:
+            expires_at, _ = next(iter(_admin_cache.values()))
+            if expires_at > now and len(_admin_cache) <= ADMIN_CACHE_MAX_ENTRIES:
+                break
+            _admin_cache.popitem(last=False)
+    return is_admin
+
+
 def admin_required(f):
     """
     Decorator for admin-only endpoints.
@@ -127,15 +264,8 @@ def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         from flask_jwt_extended import get_jwt_identity
-        import sys
-        import os
-        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-        from models import User
-        
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
         
-        if not user or not user.is_admin:
+        if not is_admin_user(get_jwt_identity()):
             return jsonify({'error': 'Admin access required'}), 403
         
         return f(*args, **kwargs)
@@ -148,15 +278,15 @@ def cleanup_rate_limit_store():
     current_time = time.time()
     max_age = 3600  # 1 ora
     
-    with _rate_limit_lock:
-        keys_to_remove = []
-        for key, timestamps in _rate_limit_store.items():
-            # Filtra timestamps vecchi
-            fresh = [t for t in timestamps if current_time - t < max_age]
-            if not fresh:
-                keys_to_remove.append(key)
-            else:
-                _rate_limit_store[key] = fresh
-        
-        for key in keys_to_remove:
-            del _rate_limit_store[key]
\ No newline at end of file
+    for store, lock in zip(_rate_limit_stores, _rate_limit_locks):
+        with lock:
+            keys_to_remove = []
+            for key, timestamps in store.items():
+                # Filtra timestamps vecchi
+                while timestamps and current_time - timestamps[0] >= max_age:
+                    timestamps.popleft()
+                if not timestamps:
+                    keys_to_remove.append(key)
+            
+            for key in keys_to_remove:
+                del store[key]
@@ -5,32 +5,152 @@ Handles sending notification emails to users.
 """
 import smtplib
 import ssl
+import time
+import queue
+import atexit
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from string import Template
+from typing import List, Union
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import logging
+from config import Config
 
 logger = logging.getLogger(__name__)
 
-# Track sent alerts to avoid spamming (node_id -> last_alert_time)
-_disk_alerts_sent = {}
-_offline_alerts_sent = {}
+# Messages sent on one SMTP connection before it is recycled (provider caps)
+SMTP_MAX_MESSAGES_PER_CONNECTION = 100
 
+# Attempts per email on connection errors, sleeping SMTP_RETRY_BACKOFF
+# seconds (doubled each time) between them
+SMTP_SEND_ATTEMPTS = 3
+SMTP_RETRY_BACKOFF = 0.5
+# Errors worth retrying on a fresh connection (not auth or recipient errors)
+_SMTP_TRANSIENT_ERRORS = (
+    smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+    ConnectionError, TimeoutError,
+)
 
-def send_email(to_email: str, subject: str, html_content: str, text_content: str = None) -> bool:
+# Idle logged-in SMTP connections: (server, messages_sent)
+_smtp_pool = None
+
+# Background senders (SMTP_POOL_SIZE threads, each using a pooled connection)
+_email_executor = None
+_email_executor_lock = threading.Lock()
+
+# Seconds before the same alert is sent again for a node
+ALERT_COOLDOWN = 3600
+# Cap on remembered alerts; the least recently sent are dropped first
+ALERT_CACHE_MAX_ENTRIES = 10000
+# Alert emails sent per minute across all nodes (critical alerts bypass it)
+ALERT_MAX_PER_MINUTE = 30
+# Disk usage / free space at which a disk alert counts as critical
+# (bypasses the rate limit and uses the shorter cooldown)
+DISK_ALERT_BYPASS_PERCENT = 99
+DISK_ALERT_BYPASS_FREE_GB = 1
+CRITICAL_ALERT_COOLDOWN = 300
+# Disk usage growth (points) that re-sends a disk alert within the cooldown
+DISK_ALERT_ESCALATION_PERCENT = 5
+
+# Track sent alerts to avoid spamming
+# ((kind, node_id) -> (last_alert_time, level reported in that alert))
+_alert_last_sent = OrderedDict()
+_alert_lock = threading.Lock()
+_alert_inserts = 0
+_pushes_last_minute = deque()
+
+
+def _connect_smtp(config):
+    """Open and authenticate a new SMTP connection."""
+    if config.SMTP_USE_SSL:
+        context = ssl.create_default_context()
+        server = smtplib.SMTP_SSL(config.SMTP_SERVER, config.SMTP_PORT, context=context)
+    else:
+        server = smtplib.SMTP(config.SMTP_SERVER, config.SMTP_PORT)
+        server.starttls()
+    server.login(config.SMTP_USER, config.SMTP_PASSWORD)
+    return server
+
+
+def _quit_smtp(server):
+    """Close an SMTP connection, ignoring errors on a dead socket."""
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+@contextmanager
+def _get_smtp(config):
+    """
+    Borrow a logged-in SMTP connection from the pool.
+    
+    Idle connections are probed with NOOP and replaced if the server dropped
+    them; connections go back to the pool unless the send failed or they
+    reached SMTP_MAX_MESSAGES_PER_CONNECTION.
+    """
+    global _smtp_pool
+    if _smtp_pool is None:
+        _smtp_pool = queue.LifoQueue(maxsize=config.SMTP_POOL_SIZE)
+    
+    try:
+        server, sent = _smtp_pool.get_nowait()
+        try:
+            if server.noop()[0] != 250:
+                raise smtplib.SMTPException('NOOP failed')
+        except (smtplib.SMTPException, OSError):
+            _quit_smtp(server)
+            server, sent = _connect_smtp(config), 0
+    except queue.Empty:
+        server, sent = _connect_smtp(config), 0
+    
+    reusable = False
+    try:
+        yield server
+        sent += 1
+        reusable = sent < SMTP_MAX_MESSAGES_PER_CONNECTION
+    finally:
+        if reusable:
+            try:
+                _smtp_pool.put_nowait((server, sent))
+            except queue.Full:
+                reusable = False
+        if not reusable:
+            _quit_smtp(server)
+
+
+@atexit.register
+def _close_smtp_pool():
+    """Log out of every pooled SMTP connection on shutdown."""
+    while _smtp_pool is not None:
+        try:
+            server, _ = _smtp_pool.get_nowait()
+        except queue.Empty:
+            break
+        _quit_smtp(server)
+
+
+def send_email(to_email: Union[str, List[str]], subject: str, html_content: str,
+               text_content: str = None, bcc: List[str] = None) -> bool:
     """
     Send an email using SMTP.
     
+    All recipients share one SMTP transaction: the message is sent once
+    with a RCPT TO per address.
+    
     Args:
-        to_email: Recipient email address
+        to_email: Recipient email address, or a list of them
         subject: Email subject
         html_content: HTML body of the email
         text_content: Plain text version (optional)
+        bcc: Extra recipients left out of the headers (optional)
     
     Returns:
         True if sent successfully, False otherwise
     """
-    from config import Config
-    
     if not Config.SMTP_PASSWORD:
         logger.warning("SMTP_PASSWORD not configured, skipping email")
         return False
@@ -39,11 +159,13 @@ def send_email(to_email: str, subject: str, html_content: str, text_content: str
         logger.warning("No recipient email provided")
         return False
     
+    recipients = [to_email] if isinstance(to_email, str) else list(to_email)
+    
     try:
         msg = MIMEMultipart('alternative')
         msg['Subject'] = subject
         msg['From'] = Config.SMTP_FROM
-        msg['To'] = to_email
+        msg['To'] = ', '.join(recipients)
         
         # Plain text version
         if text_content:
@@ -54,17 +176,19 @@ def send_email(to_email: str, subject: str, html_content: str, text_content: str
         part2 = MIMEText(html_content, 'html')
         msg.attach(part2)
         
-        # Connect and send
-        if Config.SMTP_USE_SSL:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(Config.SMTP_SERVER, Config.SMTP_PORT, context=context) as server:
-                server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
-                server.sendmail(Config.SMTP_FROM, to_email, msg.as_string())
-        else:
-            with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT) as server:
-                server.starttls()
-                server.login(Config.SMTP_USER, Config.SMTP_PASSWORD)
-                server.sendmail(Config.SMTP_FROM, to_email, msg.as_string())
+        # Send over a pooled connection (login only when a new one is opened);
+        # a failed connection is dropped, so a retry gets a fresh one
+        for attempt in range(SMTP_SEND_ATTEMPTS):
+            try:
+                with _get_smtp(Config) as server:
+                    # send_message() serializes straight to bytes (no as_string() copy)
+                    server.send_message(msg, Config.SMTP_FROM, recipients + (bcc or []))
+                break
+            except _SMTP_TRANSIENT_ERRORS as e:
+                if attempt == SMTP_SEND_ATTEMPTS - 1:
+                    raise
+                logger.warning(f"SMTP error sending to {to_email} ({e}), retrying")
+                time.sleep(SMTP_RETRY_BACKOFF * 2 ** attempt)
         
         logger.info(f"Email sent successfully to {to_email}: {subject}")
         return True
@@ -74,42 +198,130 @@ def send_email(to_email: str, subject: str, html_content: str, text_content: str
         return False
 
 
-def send_disk_full_alert(user_email: str, node_id: str, node_name: str, 
-                         disk_percent: float, disk_free_gb: float) -> bool:
+def _get_email_executor():
+    """Create the sender thread pool on first use."""
+    global _email_executor
+    with _email_executor_lock:
+        if _email_executor is None:
+            _email_executor = ThreadPoolExecutor(
+                max_workers=Config.SMTP_POOL_SIZE, thread_name_prefix='email'
+            )
+    return _email_executor
+
+
+def send_email_async(to_email: Union[str, List[str]], subject: str, html_content: str,
+                     text_content: str = None, bcc: List[str] = None):
     """
-    Send disk full alert email to node owner.
+    Send an email on the background thread pool.
     
-    Args:
-        user_email: Node owner's email
-        node_id: Node identifier
-        node_name: Node display name
-        disk_percent: Disk usage percentage
-        disk_free_gb: Free disk space in GB
+    Callers fanning out many emails can submit them all and then
+    concurrent.futures.wait() on the returned futures together.
+    
+    Returns:
+        Future resolving to send_email()'s result
     """
-    import time
-    from config import Config
+    return _get_email_executor().submit(
+        send_email, to_email, subject, html_content, text_content, bcc
+    )
+
+
+def send_email_background(to_email: Union[str, List[str]], subject: str, html_content: str,
+                          text_content: str = None, on_failure=None,
+                          bcc: List[str] = None) -> bool:
+    """
+    Queue an email for the background senders instead of blocking the caller.
     
-    # Check if we already sent an alert recently (1 hour cooldown)
-    last_alert = _disk_alerts_sent.get(node_id, 0)
-    if time.time() - last_alert < 3600:  # 1 hour cooldown
-        logger.debug(f"Disk alert for node {node_id} already sent recently, skipping")
-        return False
+    Args:
+        to_email: Recipient email address
+        subject: Email subject
+        html_content: HTML body of the email
+        text_content: Plain text version (optional)
+        on_failure: Callable run if sending fails (optional)
+        bcc: Extra recipients left out of the headers (optional)
     
-    subject = f"⚠️ AI Lightning - Disco Pieno sul Nodo {node_name}"
+    Returns:
+        True once the email is queued
+    """
+    future = send_email_async(to_email, subject, html_content, text_content, bcc)
+    if on_failure:
+        future.add_done_callback(lambda f: f.result() or on_failure())
+    return True
+
+
+@atexit.register
+def _stop_email_executor():
+    """Let the background senders finish queued emails before shutdown."""
+    if _email_executor is not None:
+        _email_executor.shutdown(wait=True)
+
+
+def _purge_expired_alerts(now: float):
+    """Drop alerts older than twice the cooldown (oldest entries come first)."""
+    while _alert_last_sent:
+        key, (sent_at, _) = next(iter(_alert_last_sent.items()))
+        if now - sent_at < 2 * ALERT_COOLDOWN:
+            break
+        del _alert_last_sent[key]
+
+
+def _decide_push(kind: str, node_id: str, severity: str = 'normal',
+                 cooldown: int = ALERT_COOLDOWN, level: float = None,
+                 escalation: float = None) -> bool:
+    """
+    Decide whether an alert email should go out, and if so mark it as sent.
     
-    html_content = f"""
+    An alert is sent when the global per-minute limit has room (critical
+    alerts skip this check) and the same alert was not sent for the node
+    within the cooldown, unless its level rose by at least `escalation`
+    since then. Marking up front keeps repeated triggers from queueing
+    duplicates; _forget_alert() clears the mark if the send fails.
+    """
+    global _alert_inserts
+    key = (kind, node_id)
+    now = time.time()
+    with _alert_lock:
+        while _pushes_last_minute and now - _pushes_last_minute[0] >= 60:
+            _pushes_last_minute.popleft()
+        if severity != 'critical' and len(_pushes_last_minute) >= ALERT_MAX_PER_MINUTE:
+            logger.warning(f"Suppressed {kind} alert for node {node_id}: rate limit reached")
+            return False
+        last_alert, last_level = _alert_last_sent.get(key, (None, None))
+        escalated = (escalation is not None and level is not None and last_level is not None
+                     and level - last_level >= escalation)
+        if last_alert is not None and now - last_alert < cooldown and not escalated:
+            logger.debug(f"Suppressed {kind} alert for node {node_id}: already sent recently")
+            return False
+        _pushes_last_minute.append(now)
+        _alert_last_sent[key] = (now, level)
+        _alert_last_sent.move_to_end(key)
+        if len(_alert_last_sent) > ALERT_CACHE_MAX_ENTRIES:
+            _alert_last_sent.popitem(last=False)
+        _alert_inserts += 1
+        if _alert_inserts % 100 == 0:
+            _purge_expired_alerts(now)
+    return True
+
+
+def _forget_alert(kind: str, node_id: str):
+    """Clear the cooldown mark for one alert."""
+    with _alert_lock:
+        _alert_last_sent.pop((kind, node_id), None)
+
+
+# Email bodies, parsed once at import and filled with Template.substitute()
+_DISK_ALERT_HTML = Template("""
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }}
-            .header {{ text-align: center; margin-bottom: 20px; }}
-            .logo {{ font-size: 24px; color: #f39c12; }}
-            .alert-box {{ background-color: #c0392b; color: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-            .info {{ background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; }}
-            .footer {{ text-align: center; margin-top: 30px; color: #888; font-size: 12px; }}
-            h1 {{ color: #f39c12; }}
+            body { font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }
+            .container { max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }
+            .header { text-align: center; margin-bottom: 20px; }
+            .logo { font-size: 24px; color: #f39c12; }
+            .alert-box { background-color: #c0392b; color: white; padding: 20px; border-radius: 8px; margin: 20px 0; }
+            .info { background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; }
+            .footer { text-align: center; margin-top: 30px; color: #888; font-size: 12px; }
+            h1 { color: #f39c12; }
         </style>
     </head>
     <body>
@@ -125,9 +337,9 @@ def send_disk_full_alert(user_email: str, node_id: str, node_name: str,
             </div>
             
             <div class="info">
-                <p><strong>Nodo:</strong> {node_name} ({node_id})</p>
-                <p><strong>Spazio usato:</strong> {disk_percent:.1f}%</p>
-                <p><strong>Spazio libero:</strong> {disk_free_gb:.1f} GB</p>
+                <p><strong>Nodo:</strong> ${node_name} (${node_id})</p>
+                <p><strong>Spazio usato:</strong> ${disk_percent}%</p>
+                <p><strong>Spazio libero:</strong> ${disk_free_gb} GB</p>
             </div>
             
             <p>Ti consigliamo di:</p>
@@ -147,16 +359,16 @@ def send_disk_full_alert(user_email: str, node_id: str, node_name: str,
         </div>
     </body>
     </html>
-    """
-    
-    text_content = f"""
+    """)
+
+_DISK_ALERT_TEXT = Template("""
     AI Lightning - Attenzione: Disco Pieno
     
     Il disco del tuo nodo sta esaurendo lo spazio!
     
-    Nodo: {node_name} ({node_id})
-    Spazio usato: {disk_percent:.1f}%
-    Spazio libero: {disk_free_gb:.1f} GB
+    Nodo: ${node_name} (${node_id})
+    Spazio usato: ${disk_percent}%
+    Spazio libero: ${disk_free_gb} GB
     
     Ti consigliamo di:
     - Rimuovere i modelli non utilizzati
@@ -164,48 +376,61 @@ def send_disk_full_alert(user_email: str, node_id: str, node_name: str,
     - Aumentare lo spazio disponibile
     
     Se il disco si riempie completamente, il nodo non sarà in grado di scaricare nuovi modelli.
-    """
-    
-    result = send_email(user_email, subject, html_content, text_content)
-    
-    if result:
-        _disk_alerts_sent[node_id] = time.time()
-    
-    return result
+    """)
 
 
-def send_node_offline_alert(user_email: str, node_id: str, node_name: str) -> bool:
+def send_disk_full_alert(user_email: str, node_id: str, node_name: str, 
+                         disk_percent: float, disk_free_gb: float,
+                         cc_admins: List[str] = None) -> bool:
     """
-    Send node offline alert email to node owner.
+    Send disk full alert email to node owner.
     
     Args:
         user_email: Node owner's email
         node_id: Node identifier
         node_name: Node display name
+        disk_percent: Disk usage percentage
+        disk_free_gb: Free disk space in GB
+        cc_admins: Addresses blind-copied on the alert (default ALERT_CC_EMAILS)
     """
-    import time
-    
-    # Check if we already sent an alert recently (1 hour cooldown)
-    last_alert = _offline_alerts_sent.get(node_id, 0)
-    if time.time() - last_alert < 3600:  # 1 hour cooldown
-        logger.debug(f"Offline alert for node {node_id} already sent recently, skipping")
+    if disk_percent >= DISK_ALERT_BYPASS_PERCENT or disk_free_gb < DISK_ALERT_BYPASS_FREE_GB:
+        severity, cooldown = 'critical', CRITICAL_ALERT_COOLDOWN
+    else:
+        severity, cooldown = 'normal', ALERT_COOLDOWN
+    if not _decide_push('disk', node_id, severity, cooldown,
+                        level=disk_percent, escalation=DISK_ALERT_ESCALATION_PERCENT):
         return False
     
-    subject = f"🔴 AI Lightning - Nodo {node_name} Offline"
+    subject = f"⚠️ AI Lightning - Disco Pieno sul Nodo {node_name}"
+    
+    fields = dict(
+        node_name=node_name, node_id=node_id,
+        disk_percent=f"{disk_percent:.1f}", disk_free_gb=f"{disk_free_gb:.1f}"
+    )
+    html_content = _DISK_ALERT_HTML.substitute(fields)
     
-    html_content = f"""
+    text_content = _DISK_ALERT_TEXT.substitute(fields)
+    
+    return send_email_background(
+        user_email, subject, html_content, text_content,
+        on_failure=lambda: _forget_alert('disk', node_id),
+        bcc=Config.ALERT_CC_EMAILS if cc_admins is None else cc_admins
+    )
+
+
+_OFFLINE_ALERT_HTML = Template("""
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }}
-            .header {{ text-align: center; margin-bottom: 20px; }}
-            .logo {{ font-size: 24px; color: #f39c12; }}
-            .alert-box {{ background-color: #7f8c8d; color: white; padding: 20px; border-radius: 8px; margin: 20px 0; }}
-            .info {{ background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; }}
-            .footer {{ text-align: center; margin-top: 30px; color: #888; font-size: 12px; }}
-            h1 {{ color: #e74c3c; }}
+            body { font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }
+            .container { max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }
+            .header { text-align: center; margin-bottom: 20px; }
+            .logo { font-size: 24px; color: #f39c12; }
+            .alert-box { background-color: #7f8c8d; color: white; padding: 20px; border-radius: 8px; margin: 20px 0; }
+            .info { background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; }
+            .footer { text-align: center; margin-top: 30px; color: #888; font-size: 12px; }
+            h1 { color: #e74c3c; }
         </style>
     </head>
     <body>
@@ -221,8 +446,8 @@ def send_node_offline_alert(user_email: str, node_id: str, node_name: str) -> bo
             </div>
             
             <div class="info">
-                <p><strong>Nodo:</strong> {node_name}</p>
-                <p><strong>ID:</strong> {node_id}</p>
+                <p><strong>Nodo:</strong> ${node_name}</p>
+                <p><strong>ID:</strong> ${node_id}</p>
             </div>
             
             <p>Possibili cause:</p>
@@ -243,15 +468,15 @@ def send_node_offline_alert(user_email: str, node_id: str, node_name: str) -> bo
         </div>
     </body>
     </html>
-    """
-    
-    text_content = f"""
+    """)
+
+_OFFLINE_ALERT_TEXT = Template("""
     AI Lightning - Nodo Offline
     
     Il tuo nodo si è disconnesso dalla rete AI Lightning.
     
-    Nodo: {node_name}
-    ID: {node_id}
+    Nodo: ${node_name}
+    ID: ${node_id}
     
     Possibili cause:
     - Problemi di connessione internet
@@ -260,14 +485,37 @@ def send_node_offline_alert(user_email: str, node_id: str, node_name: str) -> bo
     - Errore nel software
     
     Se non hai interrotto il nodo intenzionalmente, verifica lo stato del tuo sistema.
+    """)
+
+
+def send_node_offline_alert(user_email: str, node_id: str, node_name: str,
+                            cc_admins: List[str] = None) -> bool:
+    """
+    Send node offline alert email to node owner.
+    
+    Args:
+        user_email: Node owner's email
+        node_id: Node identifier
+        node_name: Node display name
+        cc_admins: Addresses blind-copied on the alert (default ALERT_CC_EMAILS)
     """
+    if not _decide_push('offline', node_id):
+        return False
     
-    result = send_email(user_email, subject, html_content, text_content)
+    subject = f"🔴 AI Lightning - Nodo {node_name} Offline"
+    
+    fields = dict(
+        node_name=node_name, node_id=node_id
+    )
+    html_content = _OFFLINE_ALERT_HTML.substitute(fields)
     
-    if result:
-        _offline_alerts_sent[node_id] = time.time()
+    text_content = _OFFLINE_ALERT_TEXT.substitute(fields)
     
-    return result
+    return send_email_background(
+        user_email, subject, html_content, text_content,
+        on_failure=lambda: _forget_alert('offline', node_id),
+        bcc=Config.ALERT_CC_EMAILS if cc_admins is None else cc_admins
+    )
 
 
 def clear_alert_cooldown(node_id: str, alert_type: str = 'all'):
@@ -278,43 +526,28 @@ def clear_alert_cooldown(node_id: str, alert_type: str = 'all'):
         node_id: Node identifier
         alert_type: 'disk', 'offline', or 'all'
     """
-    if alert_type in ('disk', 'all') and node_id in _disk_alerts_sent:
-        del _disk_alerts_sent[node_id]
-    if alert_type in ('offline', 'all') and node_id in _offline_alerts_sent:
-        del _offline_alerts_sent[node_id]
+    for kind in ('disk', 'offline'):
+        if alert_type in (kind, 'all'):
+            _forget_alert(kind, node_id)
 
 
-def send_verification_email(to_email: str, username: str, verification_link: str) -> bool:
-    """
-    Send email verification link to new user.
-    
-    Args:
-        to_email: User's email address
-        username: User's username
-        verification_link: URL to verify email
-    
-    Returns:
-        True if sent successfully, False otherwise
-    """
-    subject = "✉️ AI Lightning - Verifica la tua email"
-    
-    html_content = f"""
+_VERIFICATION_HTML = Template("""
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }}
-            .header {{ text-align: center; margin-bottom: 20px; }}
-            .logo {{ font-size: 28px; color: #f39c12; }}
-            .welcome-box {{ background-color: #0f3460; padding: 20px; border-radius: 8px; margin: 20px 0; text-align: center; }}
-            .btn {{ display: inline-block; background-color: #f39c12; color: #1a1a2e !important; padding: 15px 40px; 
-                    text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px; margin: 20px 0; }}
-            .btn:hover {{ background-color: #e67e22; }}
-            .info {{ background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; font-size: 12px; }}
-            .footer {{ text-align: center; margin-top: 30px; color: #888; font-size: 12px; }}
-            h1 {{ color: #f39c12; text-align: center; }}
-            .link-text {{ word-break: break-all; color: #888; font-size: 11px; }}
+            body { font-family: Arial, sans-serif; background-color: #1a1a2e; color: #e0e0e0; padding: 20px; }
+            .container { max-width: 600px; margin: 0 auto; background-color: #16213e; border-radius: 10px; padding: 30px; }
+            .header { text-align: center; margin-bottom: 20px; }
+            .logo { font-size: 28px; color: #f39c12; }
+            .welcome-box { background-color: #0f3460; padding: 20px; border-radius: 8px; margin: 20px 0; text-align: center; }
+            .btn { display: inline-block; background-color: #f39c12; color: #1a1a2e !important; padding: 15px 40px; 
+                    text-decoration: none; border-radius: 8px; font-weight: bold; font-size: 16px; margin: 20px 0; }
+            .btn:hover { background-color: #e67e22; }
+            .info { background-color: #0f3460; padding: 15px; border-radius: 8px; margin: 15px 0; font-size: 12px; }
+            .footer { text-align: center; margin-top: 30px; color: #888; font-size: 12px; }
+            h1 { color: #f39c12; text-align: center; }
+            .link-text { word-break: break-all; color: #888; font-size: 11px; }
         </style>
     </head>
     <body>
@@ -323,13 +556,13 @@ def send_verification_email(to_email: str, username: str, verification_link: str
                 <div class="logo">⚡ AI Lightning</div>
             </div>
             
-            <h1>Benvenuto, {username}!</h1>
+            <h1>Benvenuto, ${username}!</h1>
             
             <div class="welcome-box">
                 <p>Grazie per esserti registrato su AI Lightning!</p>
                 <p>Per completare la registrazione e attivare il tuo account, clicca sul pulsante qui sotto:</p>
                 
-                <a href="{verification_link}" class="btn">✅ Verifica Email</a>
+                <a href="${verification_link}" class="btn">✅ Verifica Email</a>
                 
                 <p style="color: #888; font-size: 13px; margin-top: 15px;">
                     Il link scade tra 24 ore.
@@ -338,7 +571,7 @@ def send_verification_email(to_email: str, username: str, verification_link: str
             
             <div class="info">
                 <p>Se il pulsante non funziona, copia e incolla questo link nel tuo browser:</p>
-                <p class="link-text">{verification_link}</p>
+                <p class="link-text">${verification_link}</p>
             </div>
             
             <p style="text-align: center; color: #888;">
@@ -352,17 +585,17 @@ def send_verification_email(to_email: str, username: str, verification_link: str
         </div>
     </body>
     </html>
-    """
-    
-    text_content = f"""
+    """)
+
+_VERIFICATION_TEXT = Template("""
     AI Lightning - Verifica la tua email
     
-    Benvenuto, {username}!
+    Benvenuto, ${username}!
     
     Grazie per esserti registrato su AI Lightning!
     Per completare la registrazione e attivare il tuo account, visita questo link:
     
-    {verification_link}
+    ${verification_link}
     
     Il link scade tra 24 ore.
     
@@ -370,6 +603,28 @@ def send_verification_email(to_email: str, username: str, verification_link: str
     
     ---
     AI Lightning - Decentralized LLM Network
+    """)
+
+
+def send_verification_email(to_email: str, username: str, verification_link: str) -> bool:
     """
+    Send email verification link to new user.
+    
+    Args:
+        to_email: User's email address
+        username: User's username
+        verification_link: URL to verify email
+    
+    Returns:
+        True if sent successfully, False otherwise
+    """
+    subject = "✉️ AI Lightning - Verifica la tua email"
+    
+    fields = dict(
+        username=username, verification_link=verification_link
+    )
+    html_content = _VERIFICATION_HTML.substitute(fields)
+    
+    text_content = _VERIFICATION_TEXT.substitute(fields)
     
     return send_email(to_email, subject, html_content, text_content)
@@ -1,14 +1,21 @@
 """
 Utility functions for the AI Lightning server.
 """
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import re
 from config import Config
 
 # Prezzo di default per modelli dinamici (sats/minuto)
 DEFAULT_DYNAMIC_MODEL_PRICE = 100
 
+# Prezzi dei modelli statici, letti una volta all'import
+_STATIC_MODEL_PRICES = {
+    name: model['price_per_minute']
+    for name, model in Config.AVAILABLE_MODELS.items()
+}
+
+# 3-80 letters, digits or underscores, with at least one non-underscore
+_USERNAME_RE = re.compile(r'\A(?=_*[^\W_])\w{3,80}\Z')
+
 
 def validate_model(model_name):
     """
@@ -39,8 +46,9 @@ def get_model_price(model_name, price_from_node=None):
         int: Price in satoshis per minute
     """
     # First check if it's a static model
-    if model_name in Config.AVAILABLE_MODELS:
-        return Config.AVAILABLE_MODELS[model_name]['price_per_minute']
+    price = _STATIC_MODEL_PRICES.get(model_name)
+    if price is not None:
+        return price
     
     # Per modelli dinamici, usa il prezzo dal nodo o il default
     if price_from_node is not None:
@@ -59,12 +67,12 @@ def format_satoshis(amount):
     Returns:
         str: Formatted string
     """
-    if amount >= 100_000_000:
-        return f"{amount / 100_000_000:.8f} BTC"
-    elif amount >= 1000:
-        return f"{amount:,} sats"
-    else:
+    # Most amounts are small: test that case first
+    if amount < 1000:
         return f"{amount} sats"
+    if amount < 100_000_000:
+        return f"{amount:,} sats"
+    return f"{amount / 100_000_000:.8f} BTC"
 
 
 def validate_username(username):
@@ -77,10 +85,7 @@ def validate_username(username):
     Returns:
         bool: True if valid
     """
-    if not username or len(username) < 3 or len(username) > 80:
-        return False
-    # Allow alphanumeric and underscore
-    return username.replace('_', '').isalnum()
+    return bool(username and _USERNAME_RE.match(username))
 
 
 def validate_password(password):
@@ -0,0 +1,30 @@
+"""
+Flask JSON provider backed by orjson.
+
+Drop-in replacement for Flask's default provider: jsonify() and
+request.get_json() keep working unchanged, but encode/decode through
+orjson instead of the stdlib json module.
+"""
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+# Dict keys are not always strings (e.g. ids used as keys). Dates go through
+# Flask's default like before (HTTP date), not orjson's native ISO 8601
+_ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider that serializes with orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = _ORJSON_OPTIONS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):  # Pretty responses (JSONIFY_PRETTYPRINT / debug)
+            option |= orjson.OPT_INDENT_2
+        # Unsupported types fall back to Flask's default (date, Decimal, __html__, ...)
+        default = kwargs.get('default', self.default)
+        return orjson.dumps(obj, default=default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
@@ -5,10 +5,11 @@ Provides JSON logging for production and colored console logging for development
 """
 import logging
 import sys
-import json
-from datetime import datetime
+import time
 from typing import Any, Dict
 
+import orjson
+
 
 class JSONFormatter(logging.Formatter):
     """
@@ -19,10 +20,21 @@ class JSONFormatter(logging.Formatter):
     def __init__(self, **kwargs):
         super().__init__()
         self.default_keys = kwargs
+        # Default keys never change: encode them once ('"app":"...",') and
+        # splice them into every line instead of merging them per record
+        self._default_json = orjson.dumps(kwargs)[1:-1] + b',' if kwargs else b''
+    
+    @staticmethod
+    def _timestamp(created: float) -> str:
+        """UTC ISO 8601 timestamp with milliseconds, from LogRecord.created."""
+        return '%s.%03dZ' % (
+            time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(created)),
+            int(created % 1 * 1000)
+        )
     
     def format(self, record: logging.LogRecord) -> str:
         log_data: Dict[str, Any] = {
-            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'timestamp': self._timestamp(record.created),
             'level': record.levelname,
             'logger': record.name,
             'message': record.getMessage(),
@@ -31,18 +43,30 @@ class JSONFormatter(logging.Formatter):
             'line': record.lineno,
         }
         
-        # Add default keys
-        log_data.update(self.default_keys)
+        # Exception and extra fields override the default keys, which
+        # override the fields above
+        overrides: Dict[str, Any] = {}
         
         # Add exception info if present
         if record.exc_info:
-            log_data['exception'] = self.formatException(record.exc_info)
+            overrides['exception'] = self.formatException(record.exc_info)
         
         # Add extra fields
         if hasattr(record, 'extra'):
-            log_data.update(record.extra)
+            overrides.update(record.extra)
+        
+        if self.default_keys.keys() & (log_data.keys() | overrides.keys()):
+            # A default key is shadowed: merge so every key is written once
+            log_data.update(self.default_keys)
+            spliced = b''
+        else:
+            spliced = self._default_json
+        log_data.update(overrides)
         
-        return json.dumps(log_data)
+        # Extra fields may hold values JSON can't represent (log them as str)
+        # and non-str dict keys such as ids, which json.dumps also accepted
+        encoded = orjson.dumps(log_data, default=str, option=orjson.OPT_NON_STR_KEYS)
+        return (b'{' + spliced + encoded[1:]).decode()
 
 
 class ColoredFormatter(logging.Formatter):
@@ -59,10 +83,22 @@ class ColoredFormatter(logging.Formatter):
     }
     RESET = '\033[0m'
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # No escape codes when output is piped to a file or journald
+        self._use_color = sys.stdout.isatty()
+    
     def format(self, record: logging.LogRecord) -> str:
-        color = self.COLORS.get(record.levelname, self.RESET)
-        record.levelname = f"{color}{record.levelname}{self.RESET}"
-        return super().format(record)
+        if not self._use_color:
+            return super().format(record)
+        # Color a copy of the level name: other handlers share this record
+        levelname = record.levelname
+        color = self.COLORS.get(levelname, self.RESET)
+        record.levelname = f"{color}{levelname}{self.RESET}"
+        try:
+            return super().format(record)
+        finally:
+            record.levelname = levelname
 
 
 def setup_logging(
@@ -152,25 +188,26 @@ class RequestLogger:
         self.logger = logger or logging.getLogger('requests')
     
     def __call__(self, environ, start_response):
-        import time
-        
-        start_time = time.time()
+        start_time = time.perf_counter()
         
         def custom_start_response(status, headers, exc_info=None):
-            # Log the request
-            duration = (time.time() - start_time) * 1000
-            self.logger.info(
-                f"{environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} "
-                f"- {status.split()[0]} - {duration:.2f}ms",
-                extra={
-                    'method': environ.get('REQUEST_METHOD'),
-                    'path': environ.get('PATH_INFO'),
-                    'status': status.split()[0],
-                    'duration_ms': round(duration, 2),
-                    'remote_addr': environ.get('REMOTE_ADDR'),
-                    'user_agent': environ.get('HTTP_USER_AGENT', '')[:100]
-                }
-            )
+            # Log the request (skip building the record when INFO is off)
+            if self.logger.isEnabledFor(logging.INFO):
+                duration = (time.perf_counter() - start_time) * 1000
+                method = environ.get('REQUEST_METHOD')
+                path = environ.get('PATH_INFO')
+                status_code = status.split(' ', 1)[0]
+                self.logger.info(
+                    f"{method} {path} - {status_code} - {duration:.2f}ms",
+                    extra={
+                        'method': method,
+                        'path': path,
+                        'status': status_code,
+                        'duration_ms': round(duration, 2),
+                        'remote_addr': environ.get('REMOTE_ADDR'),
+                        'user_agent': environ.get('HTTP_USER_AGENT', '')[:100]
+                    }
+                )
             return start_response(status, headers, exc_info)
         
         return self.app(environ, custom_start_response)
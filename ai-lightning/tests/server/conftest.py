@@ -0,0 +1,74 @@
+"""
+Fixture condivise per i test del server.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event, orm
+
+# I moduli del server usano import assoluti (from config import Config, from
+# models import db), come quando girano da ai-lightning/server: i test li
+# importano allo stesso modo, cosi' condividono il `db` registrato dall'app
+# invece di un secondo `server.models.db`.
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / 'server'))
+# Config legge DATABASE_URL all'import: i test non toccano mai il DB reale
+os.environ['DATABASE_URL'] = 'sqlite:///:memory:'
+
+
+def _enable_sqlite_savepoints(engine):
+    """
+    Let pysqlite run SAVEPOINTs, needed by the db_session rollback fixture.
+    
+    Must be called before the engine opens its first connection
+    (see "Serializable isolation / Savepoints" in SQLAlchemy's pysqlite docs).
+    """
+    @event.listens_for(engine, 'connect')
+    def _disable_pysqlite_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _emit_begin(conn):
+        conn.exec_driver_sql('BEGIN')
+
+
+@pytest.fixture(scope='session')
+def enable_sqlite_savepoints():
+    """Return the helper that enables SAVEPOINTs on a SQLite engine."""
+    return _enable_sqlite_savepoints
+
+
+@pytest.fixture
+def db_session_options():
+    """Extra sessionmaker() options for db_session; override per test module."""
+    return {}
+
+
+@pytest.fixture
+def db_session(app, db_session_options):
+    """
+    Database session rolled back after each test.
+    
+    The test runs inside an outer transaction and commits only release a
+    SAVEPOINT, so the schema built once per session stays empty between tests.
+    """
+    db = app.extensions['sqlalchemy']  # The instance the app's views use
+    # Requests made by module-scoped fixtures reuse the pushed app context
+    # and can leave its session mid-transaction on the shared SQLite
+    # connection: release it before opening the outer transaction
+    db.session.remove()
+    connection = db.engine.connect()
+    transaction = connection.begin()
+    session = orm.scoped_session(orm.sessionmaker(
+        bind=connection, join_transaction_mode='create_savepoint',
+        **db_session_options
+    ))
+    real_session, db.session = db.session, session
+    try:
+        yield session
+    finally:
+        session.remove()
+        transaction.rollback()
+        connection.close()
+        db.session = real_session
@@ -5,6 +5,8 @@ import pytest
 from unittest.mock import Mock, patch
 import json
 
+from models import db, User
+
 
 class TestConfig:
     """Test configuration class for testing."""
@@ -28,83 +30,121 @@ class TestConfig:
         return getattr(self, key, default)
 
 
-@pytest.fixture
-def app():
-    """Create test Flask app."""
-    from server.app import app
+@pytest.fixture(scope='session')
+def app(enable_sqlite_savepoints):
+    """Create test Flask app (schema built once; db_session rolls back each test)."""
+    from app import app
     app.config.from_object(TestConfig)
     
     with app.app_context():
-        from server.models import db
+        enable_sqlite_savepoints(db.engine)
         db.create_all()
         yield app
         db.drop_all()
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def client(app):
     """Create test client."""
     return app.test_client()
 
 
+@pytest.fixture(autouse=True)
+def isolated_db(db_session):
+    """Roll back whatever each API test wrote."""
+    yield
+
+
+@pytest.fixture(autouse=True, scope='module')
+def mock_lm():
+    """Stub the Lightning manager once for the whole module."""
+    with patch('app.get_lightning_manager') as mock:
+        mock.return_value.create_invoice.return_value = {
+            'payment_request': 'lnbc1000...',
+            'r_hash': 'abc123',
+            'amount': 5000
+        }
+        yield mock
+
+
+@pytest.fixture(autouse=True, scope='module')
+def mock_verification_email():
+    """Don't send real verification emails on registration."""
+    with patch('utils.email_service.send_verification_email', return_value=True) as mock:
+        yield mock
+
+
+@pytest.fixture(scope='module')
+def registered_user(client):
+    """
+    Register one user for the whole module and return its credentials.
+    
+    Module-scoped fixtures are set up before the per-test rollback
+    starts, so the user is really committed and removed at teardown.
+    """
+    credentials = {'username': 'apiuser', 'password': 'testpass123'}
+    client.post('/api/register', json={**credentials, 'email': 'apiuser@example.com'})
+    User.query.filter_by(username=credentials['username']).update({'email_verified': True})
+    db.session.commit()
+    yield credentials
+    
+    User.query.filter_by(username=credentials['username']).delete()
+    db.session.commit()
+
+
 class TestAuthAPI:
     """Test authentication endpoints."""
     
     def test_register_success(self, client):
         """Test successful user registration."""
         response = client.post('/api/register', 
-            json={'username': 'testuser', 'password': 'testpass123'})
-        assert response.status_code == 200
+            json={'username': 'testuser', 'password': 'testpass123',
+                  'email': 'testuser@example.com'})
+        assert response.status_code == 201
         data = json.loads(response.data)
         assert 'message' in data
     
-    def test_register_duplicate(self, client):
+    def test_register_duplicate(self, client, registered_user):
         """Test duplicate username registration."""
-        client.post('/api/register', 
-            json={'username': 'testuser', 'password': 'testpass123'})
         response = client.post('/api/register', 
-            json={'username': 'testuser', 'password': 'otherpass'})
+            json={'username': registered_user['username'], 'password': 'otherpass',
+                  'email': 'other@example.com'})
         assert response.status_code == 400
     
-    def test_login_success(self, client):
-        """Test successful login."""
-        client.post('/api/register', 
-            json={'username': 'testuser', 'password': 'testpass123'})
-        response = client.post('/api/login', 
-            json={'username': 'testuser', 'password': 'testpass123'})
-        assert response.status_code == 200
-        data = json.loads(response.data)
-        assert 'access_token' in data
-    
-    def test_login_invalid_credentials(self, client):
-        """Test login with invalid credentials."""
+    @pytest.mark.parametrize('username, password, status', [
+        (None, 'testpass123', 200),  # None: the registered user
+        (None, 'wrongpass', 401),
+        ('nouser', 'wrongpass', 401),
+    ])
+    def test_login(self, client, registered_user, username, password, status):
+        """Test login with valid and invalid credentials."""
         response = client.post('/api/login', 
-            json={'username': 'nouser', 'password': 'wrongpass'})
-        assert response.status_code == 401
+            json={'username': username or registered_user['username'], 'password': password})
+        assert response.status_code == status
+        if status == 200:
+            data = json.loads(response.data)
+            assert 'access_token' in data
 
 
 class TestSessionAPI:
     """Test session endpoints."""
     
-    @pytest.fixture
-    def auth_headers(self, client):
-        """Get authentication headers."""
-        client.post('/api/register', 
-            json={'username': 'testuser', 'password': 'testpass123'})
-        response = client.post('/api/login', 
-            json={'username': 'testuser', 'password': 'testpass123'})
+    @pytest.fixture(scope='module')
+    def auth_headers(self, client, registered_user):
+        """Get authentication headers, logging in only once."""
+        response = client.post('/api/login', json=registered_user)
         token = json.loads(response.data)['access_token']
         return {'Authorization': f'Bearer {token}'}
     
-    @patch('server.app.get_lightning_manager')
-    def test_new_session_success(self, mock_lm, client, auth_headers):
+    @pytest.fixture(autouse=True)
+    def online_node(self):
+        """Put one node serving the 'base' model online."""
+        node = {'models': ['base'], 'price_per_minute': 100}
+        with patch.dict('app.connected_nodes', {'node1': node}):
+            yield
+    
+    def test_new_session_success(self, client, auth_headers):
         """Test creating a new session."""
-        mock_lm.return_value.create_invoice.return_value = {
-            'payment_request': 'lnbc1000...',
-            'r_hash': 'abc123',
-            'amount': 5000
-        }
-        
         response = client.post('/api/new_session',
             json={'model': 'base', 'minutes': 5},
             headers=auth_headers)
@@ -118,16 +158,12 @@ class TestSessionAPI:
         response = client.post('/api/new_session',
             json={'model': 'invalid_model', 'minutes': 5},
             headers=auth_headers)
-        assert response.status_code == 400
+        assert response.status_code == 404  # No node serves it
     
-    def test_new_session_invalid_minutes(self, client, auth_headers):
-        """Test creating session with invalid duration."""
-        response = client.post('/api/new_session',
-            json={'model': 'base', 'minutes': 0},
-            headers=auth_headers)
-        assert response.status_code == 400
-        
+    @pytest.mark.parametrize('minutes', [0, -1, 121, 200])
+    def test_new_session_invalid_minutes(self, client, auth_headers, minutes):
+        """Test creating session with invalid duration (allowed: 1-120)."""
         response = client.post('/api/new_session',
-            json={'model': 'base', 'minutes': 200},
+            json={'model': 'base', 'minutes': minutes},
             headers=auth_headers)
         assert response.status_code == 400
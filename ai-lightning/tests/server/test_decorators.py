@@ -0,0 +1,91 @@
+"""
+Test per i decoratori del server.
+"""
+import logging
+
+import pytest
+import redis
+from flask import Flask
+from unittest.mock import Mock
+
+from utils import decorators
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    """Rate limit Redis client, reset to a clean state."""
+    client = Mock()
+    monkeypatch.setattr(decorators, '_rate_limit_redis', client)
+    monkeypatch.setattr(decorators, '_redis_retry_at', 0.0)
+    monkeypatch.setattr(decorators, '_redis_down', False)
+    monkeypatch.setattr(decorators, '_rate_limit_stores',
+                        [{} for _ in range(decorators._RATE_LIMIT_SHARDS)])
+    return client
+
+
+@pytest.fixture
+def client(redis_client):
+    """Test client of an app with one endpoint allowing 2 requests/minute."""
+    app = Flask(__name__)
+    
+    @app.route('/limited')
+    @decorators.rate_limit(max_requests=2, window_seconds=60)
+    def limited():
+        return 'ok'
+    
+    return app.test_client()
+
+
+def test_redis_rejection_is_not_counted(client, redis_client):
+    """Test that a request rejected by Redis gives its increment back."""
+    redis_client.pipeline.return_value.execute.return_value = [3, True, None]
+    assert client.get('/limited').status_code == 429
+    redis_client.decr.assert_called_once()
+
+
+def test_memory_counts_only_allowed_requests(client, redis_client):
+    """Test that rejected requests do not extend the in-memory window."""
+    redis_client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+    statuses = [client.get('/limited').status_code for _ in range(4)]
+    assert statuses == [200, 200, 429, 429]
+    [timestamps] = [t for store in decorators._rate_limit_stores for t in store.values()]
+    assert len(timestamps) == 2
+
+
+def test_redis_outage_logged_once(client, redis_client, caplog):
+    """Test that Redis is not retried on every request while it is down."""
+    redis_client.pipeline.return_value.execute.side_effect = redis.ConnectionError('down')
+    with caplog.at_level(logging.WARNING, logger=decorators.logger.name):
+        for _ in range(3):
+            client.get('/limited')
+    assert redis_client.pipeline.call_count == 1
+    assert len(caplog.records) == 1
+
+
+@pytest.fixture
+def admin_cache(monkeypatch):
+    """Empty admin cache with a fake clock; no user is an admin."""
+    user = Mock()
+    user.query.with_entities.return_value.filter_by.return_value.scalar.return_value = False
+    monkeypatch.setattr(decorators, 'User', user)
+    monkeypatch.setattr(decorators, '_admin_cache', decorators.OrderedDict())
+    clock = [1000.0]
+    monkeypatch.setattr(decorators.time, 'monotonic', lambda: clock[0])
+    return clock
+
+
+def test_admin_cache_is_bounded(admin_cache, monkeypatch):
+    """Test that the oldest entries are evicted first (cache hits don't renew them)."""
+    monkeypatch.setattr(decorators, 'ADMIN_CACHE_MAX_ENTRIES', 3)
+    for user_id in (1, 2, 3, 1, 4):
+        decorators.is_admin_user(user_id)
+    assert list(decorators._admin_cache) == [2, 3, 4]
+
+
+def test_admin_cache_drops_expired_entries(admin_cache):
+    """Test that expired lookups are purged when a new one is cached."""
+    decorators.is_admin_user(1)
+    decorators.is_admin_user(2)
+    admin_cache[0] += decorators.ADMIN_CACHE_TTL + 1
+    decorators.is_admin_user(3)
+    assert list(decorators._admin_cache) == [3]
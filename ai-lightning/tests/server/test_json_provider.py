@@ -0,0 +1,30 @@
+"""
+Test per il provider JSON basato su orjson.
+"""
+from datetime import datetime, timezone
+
+import pytest
+from flask import Flask
+
+from utils.json_provider import ORJSONProvider
+
+
+@pytest.fixture
+def provider():
+    """ORJSONProvider of a bare app."""
+    app = Flask(__name__)
+    app.json = ORJSONProvider(app)
+    return app.json
+
+
+def test_dumps_sorts_keys_like_flask(provider):
+    """Test that sort_keys is honored (Flask's default is True)."""
+    assert provider.dumps({'b': 1, 'a': 2}) == '{"a":2,"b":1}'
+    provider.sort_keys = False
+    assert provider.dumps({'b': 1, 'a': 2}) == '{"b":1,"a":2}'
+
+
+def test_dumps_datetime_as_http_date(provider):
+    """Test that datetimes keep Flask's HTTP date format."""
+    when = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+    assert provider.dumps({'at': when}) == '{"at":"Tue, 02 Jan 2024 03:04:05 GMT"}'
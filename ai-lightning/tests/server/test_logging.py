@@ -0,0 +1,38 @@
+"""
+Test per il logging strutturato.
+"""
+import json
+import logging
+
+import pytest
+
+from utils.logging import JSONFormatter
+
+
+def make_record(extra=None):
+    """Build a log record, with `extra` fields as RequestLogger sets them."""
+    record = logging.LogRecord('app', logging.INFO, __file__, 10, 'hello', None, None)
+    if extra is not None:
+        record.extra = extra
+    return record
+
+
+@pytest.mark.parametrize('defaults, extra, expected', [
+    ({'app': 'ai-lightning'}, None, {'app': 'ai-lightning', 'level': 'INFO'}),
+    ({'app': 'ai-lightning'}, {'app': 'node'}, {'app': 'node'}),  # extra wins
+    ({'level': 'AUDIT'}, None, {'level': 'AUDIT'}),  # default wins
+    ({'level': 'AUDIT'}, {'level': 'X'}, {'level': 'X'}),
+])
+def test_json_formatter_keys_written_once(defaults, extra, expected):
+    """Test that default keys colliding with record fields are not duplicated."""
+    line = JSONFormatter(**defaults).format(make_record(extra))
+    pairs = json.loads(line, object_pairs_hook=list)
+    keys = [key for key, _ in pairs]
+    assert len(keys) == len(set(keys))
+    assert expected.items() <= dict(pairs).items()
+
+
+def test_json_formatter_non_str_keys():
+    """Test that extra dicts keyed by ids are logged, not raised."""
+    line = JSONFormatter(app='ai-lightning').format(make_record({'refunds': {42: 1000}}))
+    assert json.loads(line)['refunds'] == {'42': 1000}
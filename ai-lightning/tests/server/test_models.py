@@ -3,6 +3,9 @@ Test per i modelli database.
 """
 import pytest
 from datetime import datetime, timedelta
+from flask import Flask
+
+from models import db, User, Session, Transaction
 
 
 class TestConfig:
@@ -12,165 +15,137 @@ class TestConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 
-@pytest.fixture
-def app():
-    """Create test Flask app."""
-    from flask import Flask
-    from server.models import db
-    
+@pytest.fixture(scope='session')
+def app(enable_sqlite_savepoints):
+    """Create test Flask app (schema built once; db_session rolls back each test)."""
     app = Flask(__name__)
     app.config.from_object(TestConfig)
     db.init_app(app)
     
     with app.app_context():
+        enable_sqlite_savepoints(db.engine)
         db.create_all()
         yield app
         db.drop_all()
 
 
 @pytest.fixture
-def db_session(app):
-    """Get database session."""
-    from server.models import db
-    with app.app_context():
-        yield db.session
+def db_session_options():
+    """
+    Keep attributes loaded after commit: the tests hold the objects they
+    wrote, so re-SELECTing them is wasted work (refresh() when needed).
+    """
+    return {'expire_on_commit': False}
+
+
+@pytest.fixture(scope='session')
+def hashed_password():
+    """Hash of 'pass', computed once: argon2 is deliberately slow."""
+    user = User()
+    user.set_password('pass')
+    return user.password_hash
+
+
+@pytest.fixture
+def user_factory(hashed_password):
+    """Build users to add in the same commit as the rows that reference them."""
+    def make_user(username):
+        return User(username=username, email=f'{username}@example.com',
+                    password_hash=hashed_password)
+    return make_user
 
 
 class TestUserModel:
     """Test User model."""
     
-    def test_create_user(self, app, db_session):
+    def test_create_user(self, db_session, user_factory):
         """Test creating a new user."""
-        from server.models import User
+        user = user_factory('testuser')
+        db_session.add(user)
+        db_session.commit()
         
-        with app.app_context():
-            user = User(username='testuser')
-            user.set_password('password123')
-            db_session.add(user)
-            db_session.commit()
-            
-            assert user.id is not None
-            assert user.username == 'testuser'
-            assert user.balance == 0
-            assert user.is_admin == False
+        assert user.id is not None
+        assert user.username == 'testuser'
+        assert user.balance == 0
+        assert user.is_admin == False
     
-    def test_password_hashing(self, app, db_session):
+    def test_password_hashing(self, db_session):
         """Test password is hashed correctly."""
-        from server.models import User
+        user = User(username='testuser2')
+        user.set_password('mypassword')
         
-        with app.app_context():
-            user = User(username='testuser2')
-            user.set_password('mypassword')
-            
-            assert user.password_hash != 'mypassword'
-            assert user.check_password('mypassword') == True
-            assert user.check_password('wrongpassword') == False
+        assert user.password_hash != 'mypassword'
+        assert user.check_password('mypassword') == True
+        assert user.check_password('wrongpassword') == False
     
-    def test_user_repr(self, app, db_session):
+    def test_user_repr(self, db_session):
         """Test user string representation."""
-        from server.models import User
-        
-        with app.app_context():
-            user = User(username='testuser3')
-            assert 'testuser3' in repr(user)
+        user = User(username='testuser3')
+        assert 'testuser3' in repr(user)
 
 
 class TestSessionModel:
     """Test Session model."""
     
-    def test_create_session(self, app, db_session):
-        """Test creating a new session."""
-        from server.models import User, Session
+    @pytest.fixture(scope='module')
+    def session_user(self, app, hashed_password):
+        """
+        Id of a user shared by the session tests, committed only once.
         
-        with app.app_context():
-            # Create user first
-            user = User(username='sessionuser')
-            user.set_password('pass')
-            db_session.add(user)
-            db_session.commit()
-            
-            # Create session
-            session = Session(
-                user_id=user.id,
-                node_id='node-123',
-                model='base',
-                payment_hash='abc123',
-                expires_at=datetime.utcnow() + timedelta(minutes=5)
-            )
-            db_session.add(session)
-            db_session.commit()
-            
-            assert session.id is not None
-            assert session.active == True
-    
-    def test_session_expired(self, app, db_session):
-        """Test session expiration check."""
-        from server.models import User, Session
+        Module-scoped fixtures are set up before the per-test rollback
+        starts, so the user is removed explicitly at teardown.
+        """
+        user = User(username='sessionuser', email='sessionuser@example.com',
+                    password_hash=hashed_password)
+        db.session.add(user)
+        db.session.flush()
+        user_id = user.id
+        # Read the id before committing: reloading it afterwards would leave
+        # this session in a transaction on SQLite's single shared connection
+        db.session.commit()
+        yield user_id
         
-        with app.app_context():
-            user = User(username='expireuser')
-            user.set_password('pass')
-            db_session.add(user)
-            db_session.commit()
-            
-            # Create expired session
-            session = Session(
-                user_id=user.id,
-                node_id='node-123',
-                model='base',
-                payment_hash='def456',
-                expires_at=datetime.utcnow() - timedelta(minutes=5)
-            )
-            db_session.add(session)
-            db_session.commit()
-            
-            assert session.expired == True
+        User.query.filter_by(id=user_id).delete()
+        db.session.commit()
     
-    def test_session_not_expired(self, app, db_session):
-        """Test session not expired."""
-        from server.models import User, Session
+    @pytest.mark.parametrize('minutes, expired', [
+        (5, False),
+        (-5, True),
+        (30, False),
+    ])
+    def test_session_expiry(self, db_session, session_user, minutes, expired):
+        """Test creating a session and its expiration check."""
+        session = Session(
+            user_id=session_user,
+            node_id='node-123',
+            model='base',
+            payment_hash='abc123',
+            expires_at=datetime.utcnow() + timedelta(minutes=minutes)
+        )
+        db_session.add(session)
+        db_session.commit()
         
-        with app.app_context():
-            user = User(username='activeuser')
-            user.set_password('pass')
-            db_session.add(user)
-            db_session.commit()
-            
-            session = Session(
-                user_id=user.id,
-                node_id='node-123',
-                model='base',
-                payment_hash='ghi789',
-                expires_at=datetime.utcnow() + timedelta(minutes=30)
-            )
-            db_session.add(session)
-            db_session.commit()
-            
-            assert session.expired == False
+        assert session.id is not None
+        assert session.active == True
+        assert session.expired == expired
 
 
 class TestTransactionModel:
     """Test Transaction model."""
     
-    def test_create_transaction(self, app, db_session):
+    def test_create_transaction(self, db_session, user_factory):
         """Test creating a transaction."""
-        from server.models import User, Transaction
+        user = user_factory('txuser')
+        
+        tx = Transaction(
+            type='deposit',
+            user=user,
+            amount=10000,
+            description='Test deposit'
+        )
+        db_session.add_all([user, tx])
+        db_session.commit()
         
-        with app.app_context():
-            user = User(username='txuser')
-            user.set_password('pass')
-            db_session.add(user)
-            db_session.commit()
-            
-            tx = Transaction(
-                type='deposit',
-                user_id=user.id,
-                amount=10000,
-                description='Test deposit'
-            )
-            db_session.add(tx)
-            db_session.commit()
-            
-            assert tx.id is not None
-            assert tx.amount == 10000
-            assert tx.type == 'deposit'
\ No newline at end of file
+        assert tx.id is not None
+        assert tx.amount == 10000
+        assert tx.type == 'deposit'
\ No newline at end of file
@@ -0,0 +1,246 @@
+"""
+Test per il NodeManager.
+"""
+import time
+
+import fakeredis
+import httpx
+import pytest
+from flask import Flask
+from sqlalchemy import select
+from unittest.mock import Mock, patch
+
+from models import db, User, Transaction
+from nodemanager import NodeManager, NODE_PING_TIMEOUT
+
+
+class TestConfig:
+    """Test configuration for the pay_node tests."""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+
+@pytest.fixture(scope='session')
+def app(enable_sqlite_savepoints):
+    """Create test Flask app (schema built once; db_session rolls back each test)."""
+    app = Flask(__name__)
+    app.config.from_object(TestConfig)
+    db.init_app(app)
+    
+    with app.app_context():
+        enable_sqlite_savepoints(db.engine)
+        db.create_all()
+        yield app
+        db.drop_all()
+
+
+@pytest.fixture
+def make_node_manager():
+    """Build NodeManagers sharing one in-process fake Redis (with Lua scripting)."""
+    server = fakeredis.FakeServer()
+    managers = []
+    
+    def make(**config):
+        with patch('redis.Redis.from_url',
+                   side_effect=lambda url, **kw: fakeredis.FakeRedis(server=server, **kw)):
+            nm = NodeManager(config)
+        managers.append(nm)
+        return nm
+    
+    yield make
+    for nm in managers:
+        nm.close()
+
+
+@pytest.fixture
+def node_manager(make_node_manager):
+    """NodeManager with unbuffered writes."""
+    return make_node_manager()
+
+
+def select_node(nm, model):
+    """Run node selection, bypassing the short per-model result cache."""
+    nm._selection_cache.clear()
+    node = nm.get_available_node(model)
+    return node and node['id']
+
+
+@pytest.mark.parametrize('load, expected', [
+    (3, 3),
+    (0.5, 0),
+    ('12', 12),
+    ('1.7', 1),
+    ('busy', 0),  # Invalid: the ping is still recorded, load unchanged
+    ([1], 0),
+])
+def test_node_heartbeat_load(node_manager, load, expected):
+    """Test that non-integer loads are coerced or ignored, never raised."""
+    node_id = node_manager.register_node(1, '10.0.0.1', {'base': '/models/base.bin'})
+    assert node_manager.node_heartbeat(node_id, load)
+    assert int(node_manager.redis.hget(f"node:{node_id}", 'load')) == expected
+    assert node_manager.redis.zscore('model_nodes:base', node_id) == expected
+
+
+def test_backfill_model_index_skips_websocket_nodes(node_manager):
+    """Test that only well-formed HTTP nodes are indexed by the backfill."""
+    r = node_manager.redis
+    legacy = {  # Hashes as written before the model indexes existed
+        'node-http': {'address': '10.0.0.1', 'models': '{"base": "/m/base.bin"}',
+                      'load': '2', 'status': 'online'},
+        'node-ws': {'type': 'websocket', 'status': 'online',
+                    'models': '[{"id": "base", "name": "Base"}]'},
+        'node-ws-str': {'type': 'websocket', 'models': '["base"]', 'status': 'online'},
+        'node-bad': {'address': '10.0.0.2', 'models': 'not json', 'status': 'online'},
+    }
+    for node_id, node_data in legacy.items():
+        r.hset(f"node:{node_id}", mapping=node_data)
+        r.sadd(node_manager.nodes_set_key, node_id)
+    
+    assert node_manager.backfill_model_index() == 1
+    assert r.zrange('model_nodes:base', 0, -1, withscores=True) == [('node-http', 2.0)]
+    assert r.smembers('node_models:node-http') == {'base'}
+    assert r.smembers(node_manager.online_set_key) == {'node-http'}
+    assert node_manager.get_available_node('base')['id'] == 'node-http'
+    # Idempotent
+    assert node_manager.backfill_model_index() == 1
+    assert r.zcard('model_nodes:base') == 1
+
+
+def test_stop_remote_sessions(node_manager):
+    """Test that sessions are stopped on the pooled client, counting failures out."""
+    node_id = node_manager.register_node(1, '10.0.0.1', {'base': '/models/base.bin'})
+    node_manager.node_heartbeat(node_id, 3)
+    failed = Mock()
+    failed.raise_for_status.side_effect = httpx.HTTPStatusError(
+        'boom', request=Mock(), response=Mock())
+    node_manager.http.post = Mock(side_effect=[Mock(), failed, Mock()])
+    
+    targets = [(node_id, 1), (node_id, 2), (node_id, 3), ('node-gone', 4)]
+    assert node_manager.stop_remote_sessions(targets) == 2
+    assert node_manager.http.post.call_count == 3
+    assert int(node_manager.redis.hget(f"node:{node_id}", 'load')) == 1
+    assert node_manager.redis.zscore('model_nodes:base', node_id) == 1
+
+
+class TestNodeSelection:
+    """Test node selection from the per-model indexes."""
+    
+    @pytest.fixture
+    def nodes(self, node_manager):
+        """Three online nodes: small serves base, big serves base and large."""
+        return {
+            'small': node_manager.register_node(1, '10.0.0.1', {'base': '/m/base.bin'}),
+            'big': node_manager.register_node(1, '10.0.0.2', {'base': '/m/base.bin',
+                                                              'large': '/m/large.bin'}),
+            'other': node_manager.register_node(2, '10.0.0.3', {'tiny': '/m/tiny.bin'}),
+        }
+    
+    def test_least_loaded_node_with_model(self, node_manager, nodes):
+        """Test that only nodes offering the model are picked, by load."""
+        node_manager.node_heartbeat(nodes['small'], 5)
+        assert select_node(node_manager, 'base') == nodes['big']
+        assert select_node(node_manager, 'large') == nodes['big']
+        assert select_node(node_manager, 'missing') is None
+        
+        node_manager.node_heartbeat(nodes['big'], 9)
+        assert select_node(node_manager, 'base') == nodes['small']
+    
+    def test_offline_nodes_skipped_and_pruned(self, node_manager, nodes):
+        """Test that stale online-set entries are pruned during selection."""
+        r = node_manager.redis
+        r.hset(f"node:{nodes['big']}", 'status', 'offline')
+        assert select_node(node_manager, 'large') is None
+        assert select_node(node_manager, 'base') == nodes['small']
+        assert not r.sismember(node_manager.online_set_key, nodes['big'])
+        
+        r.delete(f"node:{nodes['small']}")  # Hash gone, index entries left
+        assert select_node(node_manager, 'base') is None
+        assert r.smembers(node_manager.online_set_key) == {nodes['other']}
+    
+    def test_selection_ignores_nodes_out_of_online_set(self, node_manager, nodes):
+        """Test that nodes removed from the online set are never selected."""
+        node_manager.redis.srem(node_manager.online_set_key, nodes['big'])
+        assert select_node(node_manager, 'large') is None
+
+
+class TestHeartbeat:
+    """Test heartbeats, the offline sweep and buffered flushes."""
+    
+    def run_script(self, nm, node_id):
+        """Run the heartbeat script as _write_heartbeats does, returning its code."""
+        return nm._heartbeat_script(
+            keys=[f"node:{node_id}", nm.nodes_set_key, nm.online_set_key,
+                  nm._node_models_key(node_id)],
+            args=[time.time(), node_id, nm._model_index_key('')]
+        )
+    
+    def test_heartbeat_return_codes(self, node_manager):
+        """Test codes 0 (unknown node), 1 (online) and 2 (back online)."""
+        node_id = node_manager.register_node(1, '10.0.0.1', {'base': '/m/base.bin'})
+        assert self.run_script(node_manager, 'node-unknown') == 0
+        assert not node_manager.redis.exists('node:node-unknown')
+        assert self.run_script(node_manager, node_id) == 1
+        
+        node_manager.redis.srem(node_manager.online_set_key, node_id)
+        assert self.run_script(node_manager, node_id) == 2
+        assert node_manager.redis.sismember(node_manager.online_set_key, node_id)
+        assert node_manager.node_heartbeat('node-unknown') is False
+    
+    def test_sweep_removes_timed_out_nodes(self, node_manager):
+        """Test that only nodes past NODE_PING_TIMEOUT leave the online set."""
+        fresh = node_manager.register_node(1, '10.0.0.1', {'base': '/m/base.bin'})
+        stale = node_manager.register_node(1, '10.0.0.2', {'base': '/m/base.bin'})
+        node_manager.redis.hset(f"node:{stale}", 'last_ping',
+                                time.time() - NODE_PING_TIMEOUT - 1)
+        assert node_manager.sweep_offline_nodes() == 1
+        assert node_manager.redis.smembers(node_manager.online_set_key) == {fresh}
+        assert node_manager.sweep_offline_nodes() == 0
+    
+    def test_flush_writes_buffered_heartbeats(self, make_node_manager):
+        """Test that buffered heartbeats and earnings reach Redis on flush."""
+        nm = make_node_manager(HEARTBEAT_FLUSH_INTERVAL=3600)  # Flush by hand
+        node_id = nm.register_node(1, '10.0.0.1', {'base': '/m/base.bin'})
+        nm.redis.hset(f"node:{node_id}", 'last_ping', 0)
+        
+        assert nm.node_heartbeat(node_id, 4) is True
+        assert nm.node_heartbeat(node_id) is True  # Keeps the buffered load
+        nm._add_earnings(node_id, 300)
+        nm._add_earnings(node_id, 200)
+        node = nm.redis.hgetall(f"node:{node_id}")
+        assert (node['last_ping'], node['load'], node['total_earned']) == ('0', '0', '0')
+        
+        nm.flush()
+        node = nm.redis.hgetall(f"node:{node_id}")
+        assert float(node['last_ping']) > 0
+        assert (node['load'], node['total_earned']) == ('4', '500')
+        assert nm.redis.zscore('model_nodes:base', node_id) == 4
+        assert not nm._pending_heartbeats and not nm._pending_earnings
+
+
+@pytest.mark.parametrize('payment_address, paid, method, tx_type', [
+    ('', None, 'balance', 'node_earning'),
+    ('node@ln.example', True, 'lightning', 'node_payment'),
+    ('node@ln.example', False, 'balance', 'node_earning'),  # Falls back once
+])
+def test_pay_node_credits_once(node_manager, db_session, payment_address, paid,
+                               method, tx_type):
+    """Test that a node is paid exactly once, via Lightning or the owner balance."""
+    owner = User(username='owner', email='owner@example.com', password_hash='x')
+    db_session.add(owner)
+    db_session.commit()
+    node_id = node_manager.register_node(owner.id, '10.0.0.1', {'base': '/m/base.bin'},
+                                         payment_address=payment_address)
+    invoice = Mock(status_code=200)
+    invoice.json.return_value = {'payment_request': 'lnbc500...'}
+    node_manager.http.post = Mock(return_value=invoice)
+    lightning = Mock()
+    lightning.pay_invoice.return_value = {'success': paid, 'error': None}
+    
+    result = node_manager.pay_node(node_id, 500, 'Session 1', lightning)
+    
+    assert result == {'success': True, 'method': method, 'error': None}
+    balance = db_session.scalar(select(User.balance).where(User.id == owner.id))
+    assert balance == (500 if method == 'balance' else 0)
+    types = db_session.scalars(select(Transaction.type).where(Transaction.user_id == owner.id))
+    assert list(types) == [tx_type]
+    assert node_manager.redis.hget(f"node:{node_id}", 'total_earned') == '500'
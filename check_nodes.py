@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
+from itertools import islice
+
 import redis
 r = redis.from_url('redis://localhost:6379/0')
-nodes = r.keys('node:*')
-print('Connected nodes:', nodes)
-for n in nodes:
-    data = r.hgetall(n)
-    print(f'{n}: {data}')
+
+
+def show_hashes(pattern, label, batch_size=200):
+    """
+    Print every hash matching pattern as it is read.
+    
+    Keys come from SCAN (not KEYS) and are fetched in pipelined batches,
+    so memory stays bounded however many nodes there are.
+    """
+    print(f'{label}:')
+    keys = r.scan_iter(match=pattern, count=batch_size)
+    total = 0
+    while True:
+        batch = list(islice(keys, batch_size))
+        if not batch:
+            break
+        pipe = r.pipeline(transaction=False)
+        for key in batch:
+            pipe.hgetall(key)
+        for key, data in zip(batch, pipe.execute()):
+            print(f'{key}: {data}')
+        total += len(batch)
+    print(f'{total} found')
+
+
+show_hashes('node:*', 'Connected nodes')
 
 # Check websocket nodes
-ws_nodes = r.keys('ws_node:*')
-print('WebSocket nodes:', ws_nodes)
-for n in ws_nodes:
-    data = r.hgetall(n)
-    print(f'{n}: {data}')
+show_hashes('ws_node:*', 'WebSocket nodes')